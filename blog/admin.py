@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Post, Comment
+from .models import Post, Comment, PostRanking
 
 
 @admin.register(Post)
@@ -37,3 +37,9 @@ class CommentAdmin(admin.ModelAdmin):
     list_display = ['name', 'email', 'post', 'created', 'active']
     list_filter = ['active', 'created', 'updated']
     search_fields = ['name', 'email', 'body']
+
+
+@admin.register(PostRanking)
+class PostRankingAdmin(admin.ModelAdmin):
+    list_display = ['post', 'total_views', 'trending_views', 'updated']
+    raw_id_fields = ['post']
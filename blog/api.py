@@ -0,0 +1,320 @@
+import hashlib
+import json
+import os
+from functools import wraps
+from datetime import datetime, timedelta, timezone
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, Max, Q
+from django.http import (JsonResponse, StreamingHttpResponse,
+                         HttpResponseBadRequest, Http404)
+from django.views.decorators.http import condition, require_GET
+from .models import Post, Comment
+from .surrogate import add_surrogate_keys, post_key, tag_key, POST_LIST_KEY
+
+# fields clients may request with ?fields=, mapped to lookups for values()
+POST_FIELDS = {
+    'id': 'id',
+    'title': 'title',
+    'slug': 'slug',
+    'author': 'author__username',
+    'body': 'body',
+    'publish': 'publish',
+    'updated': 'updated',
+}
+DEFAULT_POST_FIELDS = ['id', 'title', 'slug', 'author', 'publish']
+
+COMMENT_FIELDS = {
+    'id': 'id',
+    'name': 'name',
+    'body': 'body',
+    'created': 'created',
+}
+DEFAULT_COMMENT_FIELDS = list(COMMENT_FIELDS)
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+# rows fetched per database round trip when streaming
+STREAM_CHUNK_SIZE = 500
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+
+class BadRequest(Exception):
+    pass
+
+
+def dumps(data):
+    return json.dumps(data, cls=DjangoJSONEncoder)
+
+
+def requested_fields(request, fields, default):
+    """Returns the fields listed in ?fields=, or the default fields."""
+
+    names = request.GET.get('fields')
+    if not names:
+        return default
+    names = [name.strip() for name in names.split(',') if name.strip()]
+    unknown = [name for name in names if name not in fields]
+    if unknown:
+        raise BadRequest(f"Unknown fields: {', '.join(unknown)}")
+    return names
+
+
+def requested_limit(request):
+    """Returns the page size from ?limit=, or None for ?limit=all."""
+
+    limit = request.GET.get('limit', DEFAULT_LIMIT)
+    if limit == 'all':
+        return None
+    try:
+        return max(1, min(int(limit), MAX_LIMIT))
+    except ValueError:
+        raise BadRequest('limit must be a number or "all"')
+
+
+def parse_cursor(cursor):
+    """Splits a '<microseconds since epoch>_<id>' keyset cursor."""
+
+    try:
+        micros, pk = cursor.split('_')
+        return EPOCH + int(micros) * MICROSECOND, int(pk)
+    except (ValueError, OverflowError):
+        raise BadRequest('Invalid cursor')
+
+
+def make_cursor(stamp, pk):
+    # integer microseconds keep the cursor exact and URL-safe
+    return f'{(stamp - EPOCH) // MICROSECOND}_{pk}'
+
+
+def published_posts(request):
+    """Returns published posts, filtered by ?tag= if given."""
+
+    posts = Post.objects.filter(status=Post.Status.PUBLISHED)
+    if request.GET.get('tag'):
+        posts = posts.filter(tags__slug=request.GET['tag'])
+    return posts
+
+
+def fingerprint_etag(queryset, request, stamp_field, extra=''):
+    """
+    Builds an ETag from the rows' latest change and count.
+
+    One aggregate query decides whether the client's copy is current,
+    without serializing anything. `extra` covers data the response
+    includes that does not change the rows' stamp, like tags.
+    """
+
+    summary = queryset.aggregate(latest=Max(stamp_field), count=Count('id'))
+    data = (f"{summary['latest']}:{summary['count']}:"
+            f"{request.GET.urlencode()}:{extra}")
+    return hashlib.md5(data.encode()).hexdigest()
+
+
+def api_view(etag_func):
+    """Decorator for API views: GET only, ETags and 400 on bad params."""
+
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            try:
+                return view_func(request, *args, **kwargs)
+            except BadRequest as error:
+                return HttpResponseBadRequest(
+                    dumps({'error': str(error)}),
+                    content_type='application/json')
+
+        def safe_etag(request, *args, **kwargs):
+            try:
+                return etag_func(request, *args, **kwargs)
+            except BadRequest:
+                return None
+
+        return require_GET(condition(etag_func=safe_etag)(wrapper))
+    return decorator
+
+
+def page(queryset, request, fields, lookups, order, stamp):
+    """
+    Returns one keyset page of a values() queryset, or streams all rows.
+
+    Pages are ordered by (`stamp`, id) following `order` ('-' for
+    descending), and ?cursor= continues after the last row of the
+    previous page, so deep pages cost the same as the first.
+    """
+
+    descending = order == '-'
+    cursor = request.GET.get('cursor')
+    if cursor:
+        value, pk = parse_cursor(cursor)
+        op = 'lt' if descending else 'gt'
+        queryset = queryset.filter(Q(**{f'{stamp}__{op}': value})
+                                   | Q(**{stamp: value, f'id__{op}': pk}))
+
+    queryset = queryset.order_by(f'{order}{stamp}', f'{order}id')
+    # the cursor needs the stamp and id even if the client did not ask
+    rows = queryset.values_list(*(lookups[name] for name in fields),
+                                stamp, 'id')
+
+    limit = requested_limit(request)
+    if limit is None:
+        return StreamingHttpResponse(stream(rows, fields),
+                                     content_type='application/json')
+
+    rows = list(rows[:limit + 1])
+    has_next = len(rows) > limit
+    rows = rows[:limit]
+    results = [dict(zip(fields, row)) for row in rows]
+
+    next_cursor = None
+    if has_next:
+        next_cursor = make_cursor(rows[-1][-2], rows[-1][-1])
+    return JsonResponse({'results': results, 'next': next_cursor},
+                        encoder=DjangoJSONEncoder)
+
+
+def stream(rows, fields):
+    """Yields a JSON document listing every row, chunk by chunk."""
+
+    yield '{"results": ['
+    separator = ''
+    for row in rows.iterator(chunk_size=STREAM_CHUNK_SIZE):
+        yield separator + dumps(dict(zip(fields, row)))
+        separator = ','
+    yield '], "next": null}'
+
+
+def post_list_etag(request):
+    return fingerprint_etag(published_posts(request), request, 'updated')
+
+
+@api_view(post_list_etag)
+def post_list(request):
+    """
+    Lists published posts as JSON, newest first.
+
+    Query parameters:
+        - `fields`: Comma-separated fields to include (see POST_FIELDS).
+        - `tag`: Only include posts with this tag slug.
+        - `limit`: Page size (max 100), or "all" to stream every post.
+        - `cursor`: The `next` value of the previous page.
+    """
+
+    fields = requested_fields(request, POST_FIELDS, DEFAULT_POST_FIELDS)
+    add_surrogate_keys(request, POST_LIST_KEY)
+    if request.GET.get('tag'):
+        add_surrogate_keys(request, tag_key(request.GET['tag']))
+    return page(published_posts(request), request, fields, POST_FIELDS,
+                '-', 'publish')
+
+
+def post_tag_slugs(post_id):
+    return list(Post.tags.through.objects
+                .filter(content_type=post_content_type(), object_id=post_id)
+                .order_by('tag__slug')
+                .values_list('tag__slug', flat=True))
+
+
+def post_detail_etag(request, post_id):
+    # changing a post's tags does not touch its `updated` stamp; kept on
+    # the request so the view does not repeat the query
+    request.post_tags = post_tag_slugs(post_id)
+    return fingerprint_etag(Post.objects.filter(
+        id=post_id, status=Post.Status.PUBLISHED), request, 'updated',
+        extra=request.post_tags)
+
+
+@api_view(post_detail_etag)
+def post_detail(request, post_id):
+    """Returns a published post as JSON, including its body and tags."""
+
+    fields = requested_fields(request, POST_FIELDS,
+                              [*DEFAULT_POST_FIELDS, 'body', 'updated'])
+    post = Post.objects.filter(id=post_id, status=Post.Status.PUBLISHED)\
+                       .values(*(POST_FIELDS[name] for name in fields))\
+                       .first()
+    if post is None:
+        raise Http404('No post found.')
+
+    data = {name: post[POST_FIELDS[name]] for name in fields}
+    data['tags'] = request.post_tags
+    add_surrogate_keys(request, post_key(post_id),
+                       *(tag_key(slug) for slug in data['tags']))
+    return JsonResponse(data, encoder=DjangoJSONEncoder)
+
+
+def post_comments_etag(request, post_id):
+    return fingerprint_etag(Comment.objects.filter(post_id=post_id,
+                                                   active=True),
+                            request, 'updated')
+
+
+@api_view(post_comments_etag)
+def post_comments(request, post_id):
+    """
+    Lists a published post's active comments as JSON, oldest first.
+
+    Takes the same `fields`, `limit` and `cursor` parameters as post_list.
+    """
+
+    if not Post.objects.filter(id=post_id,
+                               status=Post.Status.PUBLISHED).exists():
+        raise Http404('No post found.')
+
+    fields = requested_fields(request, COMMENT_FIELDS,
+                              DEFAULT_COMMENT_FIELDS)
+    add_surrogate_keys(request, post_key(post_id))
+    return page(Comment.objects.filter(post_id=post_id, active=True),
+                request, fields, COMMENT_FIELDS, '', 'created')
+
+
+def tag_counts():
+    """Returns (name, slug, published post count) rows for used tags."""
+
+    return Post.tags.through.objects\
+        .filter(content_type=post_content_type(),
+                object_id__in=Post.objects.filter(
+                    status=Post.Status.PUBLISHED).values('id'))\
+        .values_list('tag__name', 'tag__slug')\
+        .annotate(posts=Count('id'))\
+        .order_by('tag__name')
+
+
+def tag_list_etag(request):
+    # kept on the request so the view does not repeat the query
+    request.tag_counts = list(tag_counts())
+    return hashlib.md5(f'{request.tag_counts}'.encode()).hexdigest()
+
+
+@api_view(tag_list_etag)
+def tag_list(request):
+    """Lists tags used by published posts, with their post counts."""
+
+    add_surrogate_keys(request, POST_LIST_KEY)
+    return JsonResponse({'results': [
+        {'name': name, 'slug': slug, 'posts': posts}
+        for name, slug, posts in request.tag_counts]})
+
+
+def post_content_type():
+    return ContentType.objects.get_for_model(Post)
+
+
+@staff_member_required
+@require_GET
+def metrics(request):
+    """Returns this worker's cache and database connection pool metrics."""
+
+    # imported here so the view also loads with other database backends
+    from .db_backends.postgresql_pool.base import pool_stats
+
+    return JsonResponse({
+        'pid': os.getpid(),
+        'cache': cache.stats() if hasattr(cache, 'stats') else {},
+        'database_pools': pool_stats(),
+    })
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class BlogPostsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'blog'
+
+    def ready(self):
+        # connect signal receivers
+        from . import signals  # noqa: F401
@@ -0,0 +1,402 @@
+import math
+import random
+import threading
+import time
+from collections import Counter, OrderedDict
+from django.core.cache import caches
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+
+
+class Entry:
+    """
+    A value stored by `TwoTierCache.get_or_set()`.
+
+    Besides the value it records when the value logically expires and how
+    long it took to compute, used for early probabilistic refresh.
+    """
+
+    __slots__ = ('value', 'expires', 'delta')
+
+    def __init__(self, value, expires, delta):
+        self.value = value
+        self.expires = expires
+        self.delta = delta
+
+    def __getstate__(self):
+        return (self.value, self.expires, self.delta)
+
+    def __setstate__(self, state):
+        self.value, self.expires, self.delta = state
+
+
+class ProcessState:
+    """In-process state shared by the per-thread instances of a cache."""
+
+    def __init__(self, max_entries, timeout):
+        self.local = LocalLRU(max_entries, timeout)
+        self.flights = {}
+        self.flights_lock = threading.Lock()
+        self.counts = Counter()
+        self.counts_lock = threading.Lock()
+
+
+# Django creates a cache instance per thread, so in-process state is kept
+# here, keyed by the cache's LOCATION, like LocMemCache does
+_states = {}
+_states_lock = threading.Lock()
+
+
+def unwrap(value):
+    return value.value if isinstance(value, Entry) else value
+
+
+class LocalLRU:
+    """A thread-safe in-process LRU cache bounded by size and TTL."""
+
+    def __init__(self, max_entries, timeout):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """Returns a (found, value) tuple."""
+
+        with self.lock:
+            item = self.data.get(key)
+            if item is None:
+                return False, None
+            value, expires = item
+            if expires <= time.monotonic():
+                del self.data[key]
+                return False, None
+            self.data.move_to_end(key)
+            return True, value
+
+    def set(self, key, value, timeout=None):
+        if timeout is not None and timeout <= 0:
+            self.delete(key)
+            return
+        ttl = self.timeout if timeout is None else min(timeout, self.timeout)
+        with self.lock:
+            self.data[key] = (value, time.monotonic() + ttl)
+            self.data.move_to_end(key)
+            while len(self.data) > self.max_entries:
+                self.data.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+class TwoTierCache(BaseCache):
+    """
+    A small in-process LRU cache in front of a shared cache backend.
+
+    Reads are served from the local tier when possible and otherwise from
+    the shared backend, whose values are then kept locally for at most
+    LOCAL_TIMEOUT seconds, which bounds how stale a worker can be.
+    Writes go to both tiers. Keys starting with one of LOCAL_EXCLUDE
+    (counters, rate limit buckets, large pages) always use the shared
+    backend only.
+
+    `get_or_set()` with a callable default protects hot keys:
+        - single flight: one worker recomputes a missing or expired key
+          while the others wait for it, or keep serving the old value;
+        - early refresh: a key is recomputed a little before it expires,
+          with a probability rising as expiry gets closer (XFetch).
+
+    Hits and misses are counted per key prefix, see `stats()`.
+
+    Options:
+        - `SHARED`: Alias of the shared cache in CACHES.
+        - `LOCAL_MAX_ENTRIES`: Maximum number of keys kept in process.
+        - `LOCAL_TIMEOUT`: Maximum seconds a key is kept in process.
+        - `LOCAL_EXCLUDE`: Key prefixes never kept in process.
+        - `LOCK_TIMEOUT`: Seconds a worker may spend recomputing a key.
+        - `EARLY_REFRESH_BETA`: Eagerness of early refresh (0 disables).
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.shared_alias = options.get('SHARED', 'shared')
+        with _states_lock:
+            if location not in _states:
+                _states[location] = ProcessState(
+                    options.get('LOCAL_MAX_ENTRIES', 1000),
+                    options.get('LOCAL_TIMEOUT', 5))
+            state = _states[location]
+        self.local = state.local
+        self.flights = state.flights
+        self.flights_lock = state.flights_lock
+        self.counts = state.counts
+        self.counts_lock = state.counts_lock
+        self.local_exclude = tuple(options.get('LOCAL_EXCLUDE', ()))
+        self.lock_timeout = options.get('LOCK_TIMEOUT', 10)
+        self.beta = options.get('EARLY_REFRESH_BETA', 1.0)
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias]
+
+    # Helpers
+
+    def local_key(self, key, version):
+        if key.startswith(self.local_exclude):
+            return None
+        return self.make_and_validate_key(key, version)
+
+    def resolve_timeout(self, timeout):
+        return self.default_timeout if timeout is DEFAULT_TIMEOUT else timeout
+
+    def count(self, key, event):
+        # numeric segments (e.g. content versions) are not part of a prefix
+        parts = [part for part in key.split(':') if not part.isdigit()]
+        prefix = ':'.join(parts[:2])
+        with self.counts_lock:
+            self.counts[(prefix, event)] += 1
+
+    def stats(self):
+        """Returns {prefix: {event: count}} for this process."""
+
+        with self.counts_lock:
+            counts = dict(self.counts)
+        stats = {}
+        for (prefix, event), value in counts.items():
+            stats.setdefault(prefix, {})[event] = value
+        return stats
+
+    def lookup(self, key, version):
+        """Returns (found, stored value) from the local or shared tier."""
+
+        local_key = self.local_key(key, version)
+        if local_key is not None:
+            found, value = self.local.get(local_key)
+            if found:
+                self.count(key, 'local_hits')
+                return True, value
+
+        missing = object()
+        value = self.shared.get(key, missing, version=version)
+        if value is missing:
+            self.count(key, 'misses')
+            return False, None
+
+        self.count(key, 'shared_hits')
+        if local_key is not None:
+            self.local.set(local_key, value)
+        return True, value
+
+    def store(self, key, value, timeout, version):
+        timeout = self.resolve_timeout(timeout)
+        self.shared.set(key, value, timeout, version=version)
+        local_key = self.local_key(key, version)
+        if local_key is not None:
+            self.local.set(local_key, value, timeout)
+
+    # Cache API
+
+    def get(self, key, default=None, version=None):
+        found, value = self.lookup(key, version)
+        return unwrap(value) if found else default
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.store(key, value, timeout, version)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        timeout = self.resolve_timeout(timeout)
+        added = self.shared.add(key, value, timeout, version=version)
+        if added:
+            local_key = self.local_key(key, version)
+            if local_key is not None:
+                self.local.set(local_key, value, timeout)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, self.resolve_timeout(timeout),
+                                 version=version)
+
+    def delete(self, key, version=None):
+        local_key = self.local_key(key, version)
+        if local_key is not None:
+            self.local.delete(local_key)
+        return self.shared.delete(key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        local_key = self.local_key(key, version)
+        if local_key is not None:
+            self.local.delete(local_key)
+        return self.shared.incr(key, delta, version=version)
+
+    def decr(self, key, delta=1, version=None):
+        return self.incr(key, -delta, version=version)
+
+    def has_key(self, key, version=None):
+        return self.lookup(key, version)[0]
+
+    def get_many(self, keys, version=None):
+        values = {}
+        remote = []
+        for key in keys:
+            local_key = self.local_key(key, version)
+            found, value = (self.local.get(local_key)
+                            if local_key is not None else (False, None))
+            if found:
+                self.count(key, 'local_hits')
+                values[key] = unwrap(value)
+            else:
+                remote.append(key)
+
+        if remote:
+            fetched = self.shared.get_many(remote, version=version)
+            for key in remote:
+                if key not in fetched:
+                    self.count(key, 'misses')
+                    continue
+                self.count(key, 'shared_hits')
+                local_key = self.local_key(key, version)
+                if local_key is not None:
+                    self.local.set(local_key, fetched[key])
+                values[key] = unwrap(fetched[key])
+        return values
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        for key, value in data.items():
+            self.store(key, value, timeout, version)
+        return []
+
+    def delete_many(self, keys, version=None):
+        for key in keys:
+            local_key = self.local_key(key, version)
+            if local_key is not None:
+                self.local.delete(local_key)
+        self.shared.delete_many(keys, version=version)
+
+    def clear(self):
+        self.local.clear()
+        self.shared.clear()
+
+    def close(self, **kwargs):
+        self.shared.close(**kwargs)
+
+    # Stampede protection
+
+    def get_or_set(self, key, default, timeout=DEFAULT_TIMEOUT, version=None):
+        if not callable(default):
+            return super().get_or_set(key, default, timeout, version)
+
+        found, entry = self.lookup(key, version)
+        if found and not isinstance(entry, Entry):
+            return entry
+
+        if found and not self.should_refresh(entry):
+            return entry.value
+
+        # expired or about to expire: one worker recomputes,
+        # the others keep serving the current value
+        if found:
+            refreshed = self.recompute(key, default, timeout, version,
+                                       wait=False)
+            if refreshed is not None:
+                self.count(key, 'early_refreshes')
+                return refreshed.value
+            return entry.value
+
+        entry = self.recompute(key, default, timeout, version, wait=True)
+        return entry.value
+
+    def should_refresh(self, entry):
+        if entry.expires is None:
+            return False
+        # XFetch: refresh early with a probability that increases
+        # as expiry approaches and with the cost of recomputing
+        jitter = -entry.delta * self.beta * math.log(1 - random.random())
+        return time.time() + jitter >= entry.expires
+
+    def recompute(self, key, default, timeout, version, wait):
+        """
+        Recomputes a key if no other worker is doing so.
+
+        Returns the new Entry, or None when `wait` is false and another
+        worker holds the lock. When `wait` is true, waits for the other
+        worker's result and recomputes anyway if it takes too long.
+        """
+
+        flight = self.acquire_flight(key, version, wait)
+        if flight is None:
+            if not wait:
+                return None
+            found, entry = self.lookup(key, version)
+            if found and isinstance(entry, Entry):
+                return entry
+            # the other worker failed or timed out
+            return self.compute(key, default, timeout, version)
+
+        try:
+            return self.compute(key, default, timeout, version)
+        finally:
+            self.release_flight(key, version, flight)
+
+    def compute(self, key, default, timeout, version):
+        self.count(key, 'recomputes')
+        timeout = self.resolve_timeout(timeout)
+        start = time.time()
+        value = default()
+        delta = time.time() - start
+
+        expires = None if timeout is None else time.time() + timeout
+        entry = Entry(value, expires, delta)
+        # keep the value past its logical expiry so it can be served
+        # while it is being recomputed
+        self.store(key, entry,
+                   None if timeout is None else timeout * 2, version)
+        return entry
+
+    def acquire_flight(self, key, version, wait):
+        """
+        Takes the in-process and shared recompute locks for a key.
+
+        Returns the in-process lock, or None if another thread or worker
+        is recomputing the key. When `wait` is true, first waits up to
+        LOCK_TIMEOUT seconds for the other one to finish.
+        """
+
+        with self.flights_lock:
+            flight = self.flights.setdefault((key, version),
+                                             threading.Lock())
+
+        if wait:
+            if not flight.acquire(timeout=self.lock_timeout):
+                return None
+            # another thread of this process may have just computed it
+            found, entry = self.lookup(key, version)
+            if found and isinstance(entry, Entry):
+                flight.release()
+                return None
+        elif not flight.acquire(blocking=False):
+            return None
+
+        lock_key = f'{key}:lock'
+        deadline = time.monotonic() + self.lock_timeout
+        while not self.shared.add(lock_key, 1, self.lock_timeout,
+                                  version=version):
+            if not wait or time.monotonic() >= deadline:
+                flight.release()
+                return None
+            time.sleep(0.05)
+            found, entry = self.lookup(key, version)
+            if found and isinstance(entry, Entry):
+                flight.release()
+                return None
+        return flight
+
+    def release_flight(self, key, version, flight):
+        self.shared.delete(f'{key}:lock', version=version)
+        with self.flights_lock:
+            self.flights.pop((key, version), None)
+        flight.release()
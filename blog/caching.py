@@ -0,0 +1,64 @@
+from functools import wraps
+from django.core.cache import cache
+
+# cache key holding the current version of the published content
+VERSION_KEY = 'blog:content_version'
+
+
+def content_version():
+    """Returns the current content version, starting at 1."""
+
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, timeout=None)
+        version = cache.get(VERSION_KEY, 1)
+    return version
+
+
+def versioned_key(name, *parts):
+    """
+    Builds a cache key for content derived from published posts.
+
+    Keys embed the content version, so every cached fragment, counter
+    and page built with them is invalidated at once by
+    `invalidate_content()`.
+    """
+
+    suffix = ':'.join(str(part) for part in parts)
+    return f'blog:{content_version()}:{name}:{suffix}'
+
+
+def invalidate_content():
+    """Invalidates everything cached under a versioned key."""
+
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 2, timeout=None)
+
+
+def cache_versioned(name, timeout=60 * 15):
+    """
+    Decorator caching a view's response under a versioned key.
+
+    Only use on views whose output does not depend on the user,
+    the session or the CSRF token (e.g. the sitemap).
+    """
+
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view_func(request, *args, **kwargs)
+
+            key = versioned_key(name, request.get_full_path())
+            response = cache.get(key)
+            if response is None:
+                response = view_func(request, *args, **kwargs)
+                if hasattr(response, 'render') and callable(response.render):
+                    response.render()
+                if response.status_code == 200:
+                    cache.set(key, response, timeout)
+            return response
+        return wrapper
+    return decorator
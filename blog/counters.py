@@ -0,0 +1,211 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Sum, Q
+from django.utils import timezone
+from .models import Post, PostViewDaily, PostRanking
+
+# buffered counts expire if they are never flushed
+BUFFER_TIMEOUT = 60 * 60 * 24 * 3
+
+# seconds a post stays logged as having views to flush; bounds how long
+# its views wait if a worker died before writing it to the log
+DIRTY_TIMEOUT = 60 * 10
+
+# lock held by the process flushing the buffer
+FLUSH_LOCK_KEY = 'blog:views:flush_lock'
+
+# number of posts handled per cache and database round trip
+BATCH_SIZE = 500
+
+# WSGI environ key marking internal requests (warmup, export) whose views
+# are not counted; clients cannot set it, headers become HTTP_* keys
+SKIP_VIEW_COUNT = 'blog.skip_view_count'
+
+
+def buffer_key(date, post_id):
+    return f'blog:views:{date.isoformat()}:{post_id}'
+
+
+def log_key(date, suffix):
+    return f'blog:views:log:{date.isoformat()}:{suffix}'
+
+
+def dirty_key(date, post_id):
+    return f'blog:views:dirty:{date.isoformat()}:{post_id}'
+
+
+def increment(key, timeout=BUFFER_TIMEOUT):
+    """Atomically increments a counter in the cache, returning its value."""
+
+    if cache.add(key, 1, timeout=timeout):
+        return 1
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # the key expired between add() and incr()
+        cache.add(key, 1, timeout=timeout)
+        return 1
+
+
+def record_view(post_id):
+    """
+    Counts a view of a post in the cache-backed buffer.
+
+    Never touches the database; buffered counts are written in batches
+    by `flush_views()`. The first view of a post since its last flush
+    also appends the post to the day's log of posts to flush.
+    """
+
+    date = timezone.localdate()
+    increment(buffer_key(date, post_id))
+    if cache.add(dirty_key(date, post_id), 1, timeout=DIRTY_TIMEOUT):
+        position = increment(log_key(date, 'end'))
+        cache.set(log_key(date, position), post_id, timeout=BUFFER_TIMEOUT)
+
+
+def flush_views(days=2):
+    """
+    Writes buffered view counts to the daily rollups and rankings.
+
+    Only the posts logged by `record_view()` since the last flush are
+    read. Buffers for today and the previous `days - 1` days are drained,
+    so views counted just before midnight are not lost. Returns the number
+    of views flushed, or None if another process is already flushing.
+    """
+
+    if not cache.add(FLUSH_LOCK_KEY, 1, timeout=60 * 5):
+        return None
+
+    try:
+        today = timezone.localdate()
+        flushed = 0
+        touched = set()
+
+        for offset in range(days):
+            date = today - timedelta(days=offset)
+            post_ids, position = logged_posts(date)
+            # views counted from now on log their post again
+            cache.delete_many([dirty_key(date, post_id)
+                               for post_id in post_ids])
+            for start in range(0, len(post_ids), BATCH_SIZE):
+                # skipping posts deleted since they were read
+                batch = Post.objects.filter(
+                    id__in=post_ids[start:start + BATCH_SIZE])\
+                    .values_list('id', flat=True)
+                counts = buffered_counts(date, batch)
+                if counts:
+                    upsert_daily(date, counts)
+                    # only once the counts are stored, so a failed
+                    # upsert leaves them in the buffer
+                    release(date, counts)
+                    flushed += sum(counts.values())
+                    touched.update(counts)
+            cache.set(log_key(date, 'flushed'), position,
+                      timeout=BUFFER_TIMEOUT)
+
+        if touched:
+            refresh_rankings(touched)
+        return flushed
+    finally:
+        cache.delete(FLUSH_LOCK_KEY)
+
+
+def logged_posts(date):
+    """
+    Returns (post ids, log position) of the posts logged since the last flush.
+
+    A position counted by `record_view()` but not written yet is retried
+    by the next flush; if it is still missing then, the worker died in
+    between and it is skipped.
+    """
+
+    start = cache.get(log_key(date, 'flushed'), 0)
+    end = cache.get(log_key(date, 'end'), 0)
+    # end of the log seen by the previous flush
+    seen = cache.get(log_key(date, 'seen'), 0)
+    cache.set(log_key(date, 'seen'), end, timeout=BUFFER_TIMEOUT)
+
+    post_ids = set()
+    position = start
+    for batch in range(start + 1, end + 1, BATCH_SIZE):
+        positions = range(batch, min(batch + BATCH_SIZE, end + 1))
+        logged = cache.get_many([log_key(date, n) for n in positions])
+        for n in positions:
+            post_id = logged.get(log_key(date, n))
+            if post_id is None and n > seen:
+                return sorted(post_ids), position
+            if post_id is not None:
+                post_ids.add(post_id)
+            position = n
+    return sorted(post_ids), position
+
+
+def buffered_counts(date, post_ids):
+    """Returns the buffered counts for a batch of posts on a given date."""
+
+    keys = {buffer_key(date, post_id): post_id for post_id in post_ids}
+    return {keys[key]: value
+            for key, value in cache.get_many(keys).items() if value}
+
+
+def release(date, counts):
+    """Removes flushed counts from the buffer."""
+
+    for post_id, value in counts.items():
+        try:
+            # subtract rather than delete, keeping views counted meanwhile
+            cache.decr(buffer_key(date, post_id), value)
+        except ValueError:
+            # the key expired since it was read
+            pass
+
+
+def upsert_daily(date, counts):
+    """Adds view counts to the daily rollups in a single batched upsert."""
+
+    with transaction.atomic():
+        existing = dict(PostViewDaily.objects.select_for_update()
+                                             .filter(date=date,
+                                                     post_id__in=counts)
+                                             .values_list('post_id', 'views'))
+        PostViewDaily.objects.bulk_create(
+            [PostViewDaily(post_id=post_id, date=date,
+                           views=existing.get(post_id, 0) + views)
+             for post_id, views in counts.items()],
+            update_conflicts=True,
+            unique_fields=['post', 'date'],
+            update_fields=['views'])
+
+
+def refresh_rankings(post_ids):
+    """Recomputes the ranking rows of the given posts from their rollups."""
+
+    trending_days = getattr(settings, 'BLOG_TRENDING_DAYS', 7)
+    since = timezone.localdate() - timedelta(days=trending_days - 1)
+
+    totals = PostViewDaily.objects.filter(post_id__in=post_ids)\
+                                  .values('post_id')\
+                                  .annotate(total=Sum('views'),
+                                            trending=Sum('views',
+                                                         filter=Q(date__gte=since)))
+    PostRanking.objects.bulk_create(
+        [PostRanking(post_id=row['post_id'],
+                     total_views=row['total'],
+                     trending_views=row['trending'] or 0)
+         for row in totals],
+        update_conflicts=True,
+        unique_fields=['post'],
+        update_fields=['total_views', 'trending_views', 'updated'])
+
+
+def refresh_trending():
+    """
+    Recomputes trending counts for every ranked post.
+
+    Run once a day, after midnight, so views falling out of the
+    trending window are dropped even for posts nobody reads anymore.
+    """
+
+    refresh_rankings(PostRanking.objects.values_list('post_id', flat=True))
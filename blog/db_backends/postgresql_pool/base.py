@@ -0,0 +1,287 @@
+import os
+import threading
+import time
+from django.db import OperationalError
+from django.db.backends.postgresql import base, creation
+from django.db.backends.postgresql.base import IsolationLevel
+
+# pools of this process, keyed by (alias, database name)
+_pools = {}
+_pools_lock = threading.Lock()
+_pools_pid = os.getpid()
+
+# connections inherited from a parent process; closing them, even by
+# garbage collection, would end the session the parent still uses
+_inherited = []
+
+
+class ConnectionPool:
+    """
+    A bounded, thread-safe pool of open database connections.
+
+    Connections are handed out most recently used first. A connection
+    idle for longer than `health_check_interval` seconds is checked with
+    `SELECT 1` before being handed out, and connections older than
+    `max_age` seconds are closed instead of reused. When all `max_size`
+    connections are in use, checkouts wait up to `timeout` seconds.
+    """
+
+    def __init__(self, max_size=10, max_age=60 * 30, timeout=10,
+                 health_check_interval=30):
+        self.max_size = max_size
+        self.max_age = max_age
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        # (connection, created, last used) tuples
+        self.idle = []
+        # id(connection) -> (created, pid of the process that opened it)
+        self.created = {}
+        self.size = 0
+        self.waiting = 0
+        self.condition = threading.Condition()
+        self.metrics = {
+            'checkouts': 0,
+            'connections_opened': 0,
+            'connections_recycled': 0,
+            'connections_discarded': 0,
+            'failed_health_checks': 0,
+            'waits': 0,
+            'wait_time': 0.0,
+            'max_wait_time': 0.0,
+            'checkout_time': 0.0,
+            'timeouts': 0,
+        }
+
+    def checkout(self, connect):
+        """
+        Returns a healthy connection, opening one with `connect()` if needed.
+
+        Raises OperationalError if no connection is free within `timeout`.
+        """
+
+        start = time.monotonic()
+        deadline = start + self.timeout
+        waited = False
+
+        while True:
+            with self.condition:
+                item = None
+                while item is None:
+                    if self.idle:
+                        item = self.idle.pop()
+                    elif self.size < self.max_size:
+                        self.size += 1
+                        break
+                    else:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.metrics['timeouts'] += 1
+                            raise OperationalError(
+                                f'No database connection available within '
+                                f'{self.timeout} seconds.')
+                        waited = True
+                        self.waiting += 1
+                        self.condition.wait(remaining)
+                        self.waiting -= 1
+
+            if item is None:
+                connection = self.open(connect)
+            else:
+                connection = self.prepare(*item)
+            if connection is not None:
+                break
+
+        now = time.monotonic()
+        with self.condition:
+            self.metrics['checkouts'] += 1
+            self.metrics['checkout_time'] += now - start
+            if waited:
+                self.metrics['waits'] += 1
+                self.metrics['wait_time'] += now - start
+                self.metrics['max_wait_time'] = max(
+                    self.metrics['max_wait_time'], now - start)
+        return connection
+
+    def open(self, connect):
+        try:
+            connection = connect()
+        except Exception:
+            with self.condition:
+                self.size -= 1
+                self.condition.notify()
+            raise
+        with self.condition:
+            self.created[id(connection)] = (time.monotonic(), os.getpid())
+            self.metrics['connections_opened'] += 1
+        return connection
+
+    def prepare(self, connection, created, last_used):
+        """Returns an idle connection if it is still usable, else None."""
+
+        now = time.monotonic()
+        if now - created > self.max_age:
+            self.discard(connection, 'connections_recycled')
+            return None
+
+        if now - last_used > self.health_check_interval:
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+            except base.Database.Error:
+                self.discard(connection, 'failed_health_checks')
+                return None
+        return connection
+
+    def release(self, connection, discard=False):
+        """
+        Returns a connection to the pool, or closes it if unusable.
+
+        Connections opened by another process, such as the connection a
+        forked worker inherits from its parent, are dropped untouched:
+        they share their socket with the parent, so they must neither be
+        handed out nor closed or rolled back.
+        """
+
+        with self.condition:
+            created, pid = self.created.get(id(connection), (None, None))
+        if pid != os.getpid():
+            _inherited.append(connection)
+            return
+
+        if not discard and not connection.closed:
+            try:
+                # never hand out a connection inside a transaction
+                connection.rollback()
+            except base.Database.Error:
+                discard = True
+        if discard or connection.closed:
+            self.discard(connection, 'connections_discarded')
+            return
+
+        with self.condition:
+            self.idle.append((connection, created, time.monotonic()))
+            self.condition.notify()
+
+    def discard(self, connection, metric):
+        try:
+            connection.close()
+        except base.Database.Error:
+            pass
+        with self.condition:
+            self.created.pop(id(connection), None)
+            self.size -= 1
+            self.metrics[metric] += 1
+            self.condition.notify()
+
+    def close_idle(self):
+        """Closes every idle connection."""
+
+        with self.condition:
+            idle, self.idle = self.idle, []
+        for connection, _, _ in idle:
+            self.discard(connection, 'connections_discarded')
+
+    def stats(self):
+        """Returns the pool's size and metrics; times are in seconds."""
+
+        with self.condition:
+            stats = dict(self.metrics,
+                         size=self.size,
+                         idle=len(self.idle),
+                         in_use=self.size - len(self.idle),
+                         waiting=self.waiting,
+                         max_size=self.max_size)
+        checkouts = stats['checkouts'] or 1
+        stats['avg_checkout_time'] = stats['checkout_time'] / checkouts
+        stats['avg_wait_time'] = stats['wait_time'] / (stats['waits'] or 1)
+        return stats
+
+
+def get_pool(alias, settings_dict):
+    """Returns this process's pool for a database, creating it if needed."""
+
+    global _pools, _pools_pid
+
+    with _pools_lock:
+        # a forked worker must not share its parent's connections
+        if os.getpid() != _pools_pid:
+            _inherited.append(_pools)
+            _pools, _pools_pid = {}, os.getpid()
+
+        key = (alias, settings_dict['NAME'])
+        if key not in _pools:
+            options = settings_dict.get('POOL', {})
+            _pools[key] = ConnectionPool(
+                max_size=options.get('MAX_SIZE', 10),
+                max_age=options.get('MAX_AGE', 60 * 30),
+                timeout=options.get('TIMEOUT', 10),
+                health_check_interval=options.get('HEALTH_CHECK_INTERVAL',
+                                                  30))
+        return _pools[key]
+
+
+def close_pool(alias, name):
+    """Closes the idle connections of a database's pool and forgets it."""
+
+    with _pools_lock:
+        pool = _pools.pop((alias, name), None)
+    if pool is not None:
+        pool.close_idle()
+
+
+def pool_stats():
+    """Returns {alias: stats} for the pools of this process."""
+
+    with _pools_lock:
+        pools = dict(_pools)
+    return {alias: pool.stats() for (alias, name), pool in pools.items()}
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # pooled connections to the test database would block DROP DATABASE
+        close_pool(self.connection.alias, test_database_name)
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    The PostgreSQL backend with a connection pool per worker process.
+
+    Django opens a connection for each request (with CONN_MAX_AGE = 0) or
+    thread, and closes it when done. This backend takes those connections
+    from a pool, and returns them to it instead of closing them, so
+    connection setup, TLS and authentication are paid once per pooled
+    connection rather than once per request. Works the same under WSGI
+    and ASGI, where Django runs database code in worker threads.
+
+    Configure the pool with a POOL dict in the database settings:
+        - `MAX_SIZE`: Maximum number of connections per worker process.
+        - `MAX_AGE`: Seconds after which a connection is closed.
+        - `TIMEOUT`: Seconds to wait for a free connection.
+        - `HEALTH_CHECK_INTERVAL`: Idle seconds after which a connection is
+          checked before use.
+    """
+
+    creation_class = DatabaseCreation
+
+    @property
+    def pool(self):
+        return get_pool(self.alias, self.settings_dict)
+
+    def get_new_connection(self, conn_params):
+        connect = super().get_new_connection
+        connection = self.pool.checkout(lambda: connect(conn_params))
+
+        # set by the parent class when it opens a new connection
+        self.isolation_level = IsolationLevel(
+            self.settings_dict['OPTIONS'].get('isolation_level',
+                                              IsolationLevel.READ_COMMITTED))
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.pool.release(self.connection,
+                                  discard=self.errors_occurred)
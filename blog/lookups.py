@@ -0,0 +1,141 @@
+import hashlib
+import math
+import random
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from taggit.models import Tag
+from .models import Post
+
+# bumped whenever published post URLs or tags change
+VERSION_KEY = 'blog:lookups_version'
+
+# target false positive rate of the filter
+FALSE_POSITIVE_RATE = 0.01
+
+# seconds a built filter is used, bounding how long a wrong one can live
+FILTER_TIMEOUT = 60 * 10
+
+# filter of the current version, kept in process between requests
+_local = threading.local()
+
+
+class BloomFilter:
+    """
+    A compact set of strings that may return false positives.
+
+    `key in bloom` is False only if the key was never added; it is
+    True for every added key and, with a small probability, for others.
+    """
+
+    def __init__(self, capacity, error_rate=FALSE_POSITIVE_RATE, bits=None):
+        capacity = max(capacity, 1)
+        self.size = math.ceil(-capacity * math.log(error_rate)
+                              / math.log(2) ** 2)
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bits if bits is not None \
+            else bytearray((self.size + 7) // 8)
+
+    def positions(self, key):
+        # double hashing: the i-th position is h1 + i * h2
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, key):
+        for position in self.positions(key):
+            self.bits[position // 8] |= 1 << (position % 8)
+
+    def __contains__(self, key):
+        return all(self.bits[position // 8] & (1 << (position % 8))
+                   for position in self.positions(key))
+
+    def to_bytes(self):
+        return bytes(self.bits)
+
+    @classmethod
+    def from_bytes(cls, capacity, data):
+        return cls(capacity, bits=bytearray(data))
+
+
+def post_lookup_key(year, month, day, slug):
+    return f'post:{int(year)}-{int(month)}-{int(day)}:{slug}'
+
+
+def tag_lookup_key(slug):
+    return f'tag:{slug}'
+
+
+def build_filter():
+    """Returns (capacity, bytes) of a filter of every post and tag URL."""
+
+    keys = []
+    for slug, publish in Post.objects.filter(status=Post.Status.PUBLISHED)\
+                                     .values_list('slug', 'publish'):
+        # post_detail matches dates in the current time zone
+        publish = timezone.localtime(publish)
+        keys.append(post_lookup_key(publish.year, publish.month,
+                                    publish.day, slug))
+    keys += [tag_lookup_key(slug)
+             for slug in Tag.objects.values_list('slug', flat=True)]
+
+    bloom = BloomFilter(len(keys))
+    for key in keys:
+        bloom.add(key)
+    return len(keys), bloom.to_bytes()
+
+
+def current_filter():
+    """
+    Returns the Bloom filter of the current version.
+
+    The filter is built by one worker and shared through the cache; each
+    thread keeps the deserialized filter until the version changes, or
+    for at most FILTER_TIMEOUT seconds.
+    """
+
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # a random start, so filters kept in process from before the
+        # cache was cleared do not match the new version
+        cache.add(VERSION_KEY, random_version(), timeout=None)
+        version = cache.get(VERSION_KEY, 0)
+
+    if (getattr(_local, 'version', None) != version
+            or _local.expires <= time.monotonic()):
+        capacity, data = cache.get_or_set(f'blog:lookups:{version}',
+                                          build_filter,
+                                          timeout=FILTER_TIMEOUT)
+        _local.filter = BloomFilter.from_bytes(capacity, data)
+        _local.version = version
+        _local.expires = time.monotonic() + FILTER_TIMEOUT
+    return _local.filter
+
+
+def may_exist(key):
+    """Returns False if the URL for a lookup key certainly does not exist."""
+
+    if not getattr(settings, 'BLOG_NEGATIVE_LOOKUPS', True):
+        return True
+    return key in current_filter()
+
+
+def invalidate_lookups():
+    """
+    Makes workers rebuild the filter, after URLs were added or removed.
+
+    Call it once the change is committed (see `transaction.on_commit`),
+    or a worker may rebuild the new version from the old data.
+    """
+
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, random_version(), timeout=None)
+
+
+def random_version():
+    return random.randrange(1, 2 ** 31)
@@ -0,0 +1,96 @@
+import time
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+from django.urls import reverse
+from blog.models import Post
+
+# posts per page of views.post_list
+POSTS_PER_PAGE = 3
+
+
+class Command(BaseCommand):
+    """
+    Compares the cost per post of the JSON API and the HTML post list.
+
+    Both are requested through the full middleware stack with caching
+    disabled, and the total time is divided by the number of posts
+    returned. The API is fetched in pages of the HTML list's size, so
+    both sides make the same number of requests and per-request overhead
+    does not count in the API's favour.
+    """
+
+    help = 'Benchmarks per-item cost of the JSON API against the HTML list.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=90,
+                            help='Number of posts to fetch per round.')
+        parser.add_argument('--rounds', type=int, default=5,
+                            help='Number of rounds to average over.')
+
+    def handle(self, *args, **options):
+        with override_settings(
+                ALLOWED_HOSTS=['*'],
+                CACHES={'default': {
+                    'BACKEND': 'django.core.cache.backends.dummy.'
+                               'DummyCache'}}):
+            client = Client()
+            html = self.measure(options['rounds'],
+                                lambda: self.fetch_html(client,
+                                                        options['items']))
+            api = self.measure(options['rounds'],
+                               lambda: self.fetch_api(client,
+                                                      options['items']))
+
+        for name, (seconds, items, size, requests) in (('HTML', html),
+                                                       ('API', api)):
+            per_item = seconds / max(items, 1) * 1000
+            self.stdout.write(f'{name:5} {per_item:8.3f} ms/post '
+                              f'{size / max(items, 1):9.0f} bytes/post '
+                              f'({items:.0f} posts, {requests:.0f} requests)')
+        if html[1] and api[1]:
+            ratio = (html[0] / html[1]) / max(api[0] / api[1], 1e-9)
+            self.stdout.write(f'The API is {ratio:.1f}x cheaper per post.')
+
+    def measure(self, rounds, fetch):
+        """Returns average (seconds, items, bytes, requests) of a fetch."""
+
+        totals = [0, 0, 0, 0]
+        for _ in range(rounds):
+            start = time.perf_counter()
+            items, size, requests = fetch()
+            totals[0] += time.perf_counter() - start
+            totals[1] += items
+            totals[2] += size
+            totals[3] += requests
+        return [total / rounds for total in totals]
+
+    def fetch_html(self, client, items):
+        """Fetches post list pages until `items` posts were rendered."""
+
+        fetched = min(items, Post.objects.filter(
+            status=Post.Status.PUBLISHED).count())
+        pages = -(-fetched // POSTS_PER_PAGE)
+        size = 0
+        for page in range(1, pages + 1):
+            response = client.get(reverse('blog:post_list'), {'page': page})
+            size += len(response.content)
+        return fetched, size, pages
+
+    def fetch_api(self, client, items):
+        """Fetches posts from the JSON API, following cursors."""
+
+        fetched = size = requests = 0
+        cursor = None
+        while fetched < items:
+            params = {'limit': min(items - fetched, POSTS_PER_PAGE)}
+            if cursor:
+                params['cursor'] = cursor
+            data = client.get(reverse('blog:api_post_list'), params)
+            requests += 1
+            size += len(data.content)
+            data = data.json()
+            fetched += len(data['results'])
+            cursor = data['next']
+            if not cursor:
+                break
+        return fetched, size, requests
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from blog.similarity import build_similar_posts
+
+
+class Command(BaseCommand):
+    """
+    Builds the "more like this" recommendations shown by post_detail.
+
+    Posts are compared by the cosine similarity of TF-IDF vectors built
+    from their titles and bodies. By default only new or edited posts
+    (and the posts whose recommendations they affect) are re-scored.
+    """
+
+    help = 'Computes similar post recommendations from post content.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Re-score every post instead of only new '
+                                 'and edited ones.')
+        parser.add_argument('--top-k', type=int, default=4,
+                            help='Number of similar posts stored per post.')
+        parser.add_argument('--batch-size', type=int, default=256,
+                            help='Number of posts scored per batch; bounds '
+                                 'memory use.')
+
+    def handle(self, *args, **options):
+        updated = build_similar_posts(k=options['top_k'],
+                                      batch_size=options['batch_size'],
+                                      full=options['full'])
+        self.stdout.write(f'Updated recommendations for {updated} posts.')
@@ -0,0 +1,67 @@
+import os
+import subprocess
+import sys
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    """
+    Measures how long a new worker spends importing the project.
+
+    Imports the WSGI or ASGI entry point and the URLconf in a fresh
+    interpreter with `-X importtime`, reports the slowest top-level
+    imports, and fails when the total exceeds BLOG_IMPORT_TIME_BUDGET_MS.
+    """
+
+    help = 'Checks worker import time against the configured budget.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entry', choices=['wsgi', 'asgi'],
+                            default='wsgi',
+                            help='Entry point to import.')
+        parser.add_argument('--budget', type=float,
+                            help='Budget in milliseconds (defaults to '
+                                 'BLOG_IMPORT_TIME_BUDGET_MS).')
+        parser.add_argument('--top', type=int, default=10,
+                            help='Number of slowest imports to list.')
+
+    def handle(self, *args, **options):
+        budget = options['budget'] or getattr(
+            settings, 'BLOG_IMPORT_TIME_BUDGET_MS', 1500)
+        code = (f"import mysite.{options['entry']}; "
+                f"import {settings.ROOT_URLCONF}")
+
+        env = dict(os.environ,
+                   DJANGO_SETTINGS_MODULE=os.environ.get(
+                       'DJANGO_SETTINGS_MODULE', 'mysite.settings'))
+        result = subprocess.run([sys.executable, '-X', 'importtime',
+                                 '-c', code],
+                                capture_output=True, text=True, env=env)
+        if result.returncode:
+            raise CommandError(f'Importing failed:\n{result.stderr}')
+
+        imports = self.top_level_imports(result.stderr)
+        total = sum(imports.values()) / 1000
+
+        slowest = sorted(imports.items(), key=lambda item: -item[1])
+        for module, micros in slowest[:options['top']]:
+            self.stdout.write(f'{micros / 1000:9.1f} ms  {module}')
+        self.stdout.write(f'{total:9.1f} ms  total (budget {budget:.0f} ms)')
+
+        if total > budget:
+            raise CommandError(f'Import time {total:.1f} ms exceeds the '
+                               f'budget of {budget:.0f} ms.')
+
+    def top_level_imports(self, output):
+        """Returns cumulative microseconds of each top-level import."""
+
+        imports = {}
+        for line in output.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            _, cumulative, module = line.split('|')
+            # nested imports are indented under the module importing them
+            if not module.startswith('  '):
+                imports[module.strip()] = int(cumulative)
+        return imports
@@ -0,0 +1,246 @@
+import hashlib
+import json
+import re
+from datetime import timedelta
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from taggit.models import Tag
+from blog.models import Post, Comment
+
+# literals replaced when fingerprinting a query
+LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+
+class Command(BaseCommand):
+    """
+    Checks the query plans of the blog's views for regressions.
+
+    Requests each view, captures every SELECT it issues and runs
+    EXPLAIN (ANALYZE, BUFFERS) on it. Plans are flagged for sequential
+    scans and estimated rows above --rows-threshold, and for sorts that
+    spill to disk. Flags and costs are compared against a baseline file;
+    the command fails when a query gains a flag or its cost grows by more
+    than --cost-tolerance.
+
+    With --seed, a dataset of the given number of posts is created
+    inside a transaction that is rolled back afterwards.
+    Requires PostgreSQL.
+    """
+
+    help = 'Runs EXPLAIN ANALYZE on the queries of each view and ' \
+           'compares the plans against a baseline.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Number of posts to generate before '
+                                 'checking (rolled back afterwards).')
+        parser.add_argument('--comments-per-post', type=int, default=20,
+                            help='Number of comments generated per post.')
+        parser.add_argument('--baseline',
+                            default=str(settings.BASE_DIR
+                                        / 'query_plans.json'),
+                            help='Path of the baseline file.')
+        parser.add_argument('--update-baseline', action='store_true',
+                            help='Write the current plans as the new '
+                                 'baseline.')
+        parser.add_argument('--rows-threshold', type=int, default=1000,
+                            help='Flag scans estimated to return more rows.')
+        parser.add_argument('--cost-tolerance', type=float, default=0.5,
+                            help='Allowed relative cost increase over the '
+                                 'baseline.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Query plans can only be checked on '
+                               'PostgreSQL.')
+
+        self.rows_threshold = options['rows_threshold']
+        if options['seed']:
+            self.vacuum()
+        with transaction.atomic():
+            if options['seed']:
+                self.seed(options['seed'], options['comments_per_post'])
+            # views must hit the database, not the cache
+            with override_settings(
+                    ALLOWED_HOSTS=['*'],
+                    CACHES={'default': {
+                        'BACKEND': 'django.core.cache.backends.dummy.'
+                                   'DummyCache'}}):
+                plans = self.collect_plans()
+            transaction.set_rollback(True)
+        if options['seed']:
+            # rolled back rows stay in the tables as dead tuples, which
+            # would raise the estimated costs of every later run
+            self.vacuum()
+
+        for key, plan in sorted(plans.items()):
+            flags = ', '.join(plan['flags']) or 'ok'
+            self.stdout.write(f"{key}  cost={plan['cost']:.1f}  {flags}")
+
+        if options['update_baseline']:
+            with open(options['baseline'], 'w') as baseline:
+                json.dump(plans, baseline, indent=2, sort_keys=True)
+            self.stdout.write(f"Baseline written to {options['baseline']}")
+            return
+
+        try:
+            with open(options['baseline']) as baseline:
+                regressions = self.compare(json.load(baseline), plans,
+                                           options['cost_tolerance'])
+        except FileNotFoundError:
+            raise CommandError(f"No baseline at {options['baseline']}, "
+                               f"run with --update-baseline first.")
+
+        for regression in regressions:
+            self.stderr.write(regression)
+        if regressions:
+            raise CommandError(f'{len(regressions)} query plan regressions.')
+        self.stdout.write('No query plan regressions.')
+
+    def seed(self, count, comments_per_post):
+        """Generates published posts with tags and comments."""
+
+        author, _ = User.objects.get_or_create(username='plan-check')
+        now = timezone.now()
+        tags = [Tag.objects.get_or_create(name=f'plan-check-{i}',
+                                          slug=f'plan-check-{i}')[0]
+                for i in range(20)]
+
+        posts = Post.objects.bulk_create(
+            [Post(title=f'Plan check post {i}',
+                  slug=f'plan-check-{i}',
+                  author=author,
+                  body=f'Generated post number {i} about databases.',
+                  publish=now - timedelta(hours=i),
+                  status=(Post.Status.PUBLISHED if i % 10
+                          else Post.Status.DRAFT))
+             for i in range(count)],
+            batch_size=1000)
+
+        Post.tags.through.objects.bulk_create(
+            [Post.tags.through(content_object=post, tag=tags[i % len(tags)])
+             for i, post in enumerate(posts)],
+            batch_size=1000)
+        Comment.objects.bulk_create(
+            [Comment(post=post, name='Reader', email='reader@example.com',
+                     body='Generated comment.', active=bool(j % 5))
+             for post in posts for j in range(comments_per_post)],
+            batch_size=1000)
+
+        # refresh planner statistics for the new rows
+        with connection.cursor() as cursor:
+            for model in (Post, Comment, Post.tags.through):
+                cursor.execute(f'ANALYZE {model._meta.db_table}')
+
+    def vacuum(self):
+        """Removes dead rows from the seeded tables (outside transactions)."""
+
+        with connection.cursor() as cursor:
+            for model in (Post, Comment, Post.tags.through, Tag, User):
+                cursor.execute(f'VACUUM ANALYZE {model._meta.db_table}')
+
+    def requests(self):
+        """Returns (view name, method, url, data) tuples to check."""
+
+        post = Post.objects.filter(status=Post.Status.PUBLISHED)\
+                           .order_by('-publish').first()
+        tag = Tag.objects.order_by('id').first()
+
+        requests = [
+            ('homepage', 'get', reverse('blog:homepage'), None),
+            ('post_list', 'get', reverse('blog:post_list'), None),
+            ('post_list_page_2', 'get',
+             f"{reverse('blog:post_list')}?page=2", None),
+            ('post_search', 'post', reverse('blog:post_search'),
+             {'query': 'databases'}),
+            ('sitemap', 'get', '/sitemap.xml', None),
+        ]
+        if post:
+            requests.append(('post_detail', 'get',
+                             post.get_absolute_url(), None))
+        if tag:
+            requests.append(('post_list_by_tag', 'get',
+                             reverse('blog:post_list_by_tag',
+                                     args=[tag.slug]), None))
+        return requests
+
+    def collect_plans(self):
+        """Returns {query key: {'sql', 'flags', 'cost'}} for every view."""
+
+        client = Client()
+        plans = {}
+        for name, method, url, data in self.requests():
+            with CaptureQueriesContext(connection) as captured:
+                getattr(client, method)(url, data)
+
+            for query in captured.captured_queries:
+                sql = query['sql']
+                if not sql.lstrip().upper().startswith('SELECT'):
+                    continue
+                plan = self.explain(sql)
+                plans[f'{name}:{self.fingerprint(sql)}'] = {
+                    'sql': sql,
+                    'flags': sorted(set(self.flags(plan))),
+                    'cost': plan['Total Cost'],
+                }
+        return plans
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}')
+            result = cursor.fetchone()[0]
+        if isinstance(result, str):
+            result = json.loads(result)
+        return result[0]['Plan']
+
+    def fingerprint(self, sql):
+        """Identifies a query independently of its literal values."""
+
+        normalized = LITERAL_RE.sub('?', sql)
+        return hashlib.sha1(normalized.encode()).hexdigest()[:12]
+
+    def flags(self, node):
+        """Yields the problems found in a plan node and its children."""
+
+        node_type = node['Node Type']
+        relation = node.get('Relation Name', '')
+
+        if (node_type == 'Seq Scan'
+                and node['Plan Rows'] > self.rows_threshold):
+            yield f'seq_scan:{relation}'
+        if node.get('Sort Space Type') == 'Disk':
+            yield 'sort_spill'
+        elif (node_type.endswith('Scan')
+                and node['Plan Rows'] > self.rows_threshold):
+            yield f'rows:{relation or node_type}'
+
+        for child in node.get('Plans', []):
+            yield from self.flags(child)
+
+    def compare(self, baseline, plans, tolerance):
+        """Returns a description of each plan that got worse."""
+
+        regressions = []
+        for key, plan in sorted(plans.items()):
+            known = baseline.get(key)
+            if known is None:
+                if plan['flags']:
+                    regressions.append(f"{key}: new query with "
+                                       f"{', '.join(plan['flags'])}\n"
+                                       f"  {plan['sql']}")
+                continue
+
+            new_flags = set(plan['flags']) - set(known['flags'])
+            if new_flags:
+                regressions.append(f"{key}: {', '.join(sorted(new_flags))}\n"
+                                   f"  {plan['sql']}")
+            elif plan['cost'] > known['cost'] * (1 + tolerance):
+                regressions.append(f"{key}: cost {known['cost']:.1f} -> "
+                                   f"{plan['cost']:.1f}\n  {plan['sql']}")
+        return regressions
@@ -0,0 +1,270 @@
+import gzip
+import hashlib
+import json
+import multiprocessing
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from django.core.management.base import BaseCommand, CommandError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Count, Max, Q
+from django.test import override_settings
+from django.urls import reverse
+from taggit.models import Tag
+from blog.models import Post, SimilarPost
+from blog.templatetags.blog_tags import (show_latest_posts,
+                                         get_most_commented_posts,
+                                         get_most_read_posts)
+
+# posts per page of views.post_list
+POSTS_PER_PAGE = 3
+
+MANIFEST_NAME = '.export-manifest.json'
+
+
+def output_path(url, page=1):
+    """
+    Maps a URL to the file it is exported to, relative to the output dir.
+
+    '/blog/posts/' becomes 'blog/posts/index.html', its second page
+    'blog/posts/page-2.html' and a post '/blog/2023/11/5/slug' becomes
+    'blog/2023/11/5/slug.html'. nginx can serve list pages with
+    `try_files $uri/page-$arg_page.html $uri/index.html`.
+    """
+
+    path = url.lstrip('/')
+    if page > 1:
+        return f'{path}page-{page}.html'
+    if not path or path.endswith('/'):
+        return f'{path}index.html'
+    if '.' in path.rsplit('/', 1)[-1]:
+        return path
+    return f'{path}.html'
+
+
+def init_worker():
+    # connections inherited from the parent process must not be shared
+    connections.close_all()
+
+
+def render_page(output_dir, path, url):
+    """Renders a URL and writes it, plus a gzipped copy, to the output dir."""
+
+    from django.test import Client
+    from blog.counters import SKIP_VIEW_COUNT
+    from blog.warmup import warmup_host
+
+    response = Client(HTTP_HOST=warmup_host(), raise_request_exception=False,
+                      **{SKIP_VIEW_COUNT: True}).get(url)
+    if response.status_code != 200:
+        return path, response.status_code
+
+    target = Path(output_dir) / path
+    target.parent.mkdir(parents=True, exist_ok=True)
+    write_atomic(target, response.content)
+    # mtime=0 keeps unchanged pages byte-identical between exports
+    write_atomic(target.with_name(target.name + '.gz'),
+                 gzip.compress(response.content, compresslevel=9, mtime=0))
+    return path, response.status_code
+
+
+def write_atomic(target, content):
+    temporary = target.with_name(f'.{target.name}.tmp')
+    temporary.write_bytes(content)
+    os.replace(temporary, target)
+
+
+def digest(*parts):
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+class Command(BaseCommand):
+    """
+    Exports the published blog as static HTML files for nginx.
+
+    Renders the homepage, every published post, every post list and tag
+    page, and the sitemap, using a pool of worker processes, and writes
+    a gzipped copy of every file next to it (for `gzip_static on`).
+
+    Each page has a fingerprint of the data it shows: the `updated`
+    timestamps, comments, tags and similar posts of its posts, and the
+    sidebar contents shown on every page. Fingerprints are kept in a manifest in the output
+    directory, so later exports only re-render the pages that changed
+    and remove the pages that no longer exist.
+    """
+
+    help = 'Renders the published blog to static files.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output_dir',
+                            help='Directory to write the files to.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Number of rendering processes.')
+        parser.add_argument('--full', action='store_true',
+                            help='Re-render every page, ignoring the '
+                                 'manifest.')
+
+    def handle(self, *args, **options):
+        output_dir = Path(options['output_dir']).resolve()
+        output_dir.mkdir(parents=True, exist_ok=True)
+        manifest_path = output_dir / MANIFEST_NAME
+
+        manifest = {}
+        if manifest_path.exists() and not options['full']:
+            manifest = json.loads(manifest_path.read_text())
+
+        # render from the database, without counting views or using caches
+        with override_settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}):
+            pages = self.pages()
+            changed = {path: url for path, (url, fingerprint) in pages.items()
+                       if manifest.get(path) != fingerprint
+                       or not (output_dir / path).exists()}
+
+            failed = self.render(output_dir, changed, options['workers'])
+
+        removed = [path for path in manifest if path not in pages]
+        for path in removed:
+            for name in (path, f'{path}.gz'):
+                (output_dir / name).unlink(missing_ok=True)
+
+        new_manifest = {path: fingerprint
+                        for path, (url, fingerprint) in pages.items()
+                        if path not in failed}
+        write_atomic(manifest_path,
+                     json.dumps(new_manifest, indent=2,
+                                sort_keys=True).encode())
+
+        self.stdout.write(f'Rendered {len(changed) - len(failed)} pages, '
+                          f'{len(pages) - len(changed)} unchanged, '
+                          f'{len(removed)} removed.')
+        if failed:
+            raise CommandError(f'{len(failed)} pages failed: '
+                               f"{', '.join(sorted(failed))}")
+
+    def render(self, output_dir, changed, workers):
+        """Renders pages in a process pool, returns the paths that failed."""
+
+        if not changed:
+            return set()
+
+        # forked workers must open their own connections
+        connections.close_all()
+        failed = set()
+        # workers rely on inheriting the configured Django and the cache
+        # override, which spawn and forkserver workers would not
+        with ProcessPoolExecutor(max_workers=workers,
+                                 mp_context=multiprocessing.get_context(
+                                     'fork'),
+                                 initializer=init_worker) as pool:
+            results = [pool.submit(render_page, str(output_dir), path, url)
+                       for path, url in changed.items()]
+            for result in results:
+                path, status = result.result()
+                if status != 200:
+                    failed.add(path)
+                    self.stderr.write(f'{status} {changed[path]}')
+        return failed
+
+    def pages(self):
+        """Returns {output path: (url, fingerprint)} for every page."""
+
+        # deleting a comment other than the latest changes only the count
+        comments = {'comments_updated': Max('comments__updated'),
+                    'active_comments': Count(
+                        'comments', filter=Q(comments__active=True))}
+        posts = list(Post.objects.filter(status=Post.Status.PUBLISHED)
+                                 .prefetch_related('tags')
+                                 .annotate(**comments)
+                                 .order_by('-publish'))
+        post_data = {post.id: (post.updated.isoformat(),
+                               str(post.comments_updated),
+                               post.active_comments,
+                               sorted(tag.slug for tag in post.tags.all()))
+                     for post in posts}
+
+        similar = {}
+        for post_id, similar_id, title in SimilarPost.objects.filter(
+                post__in=post_data,
+                similar__status=Post.Status.PUBLISHED).values_list(
+                    'post_id', 'similar_id', 'similar__title'):
+            similar.setdefault(post_id, []).append((similar_id, title))
+        # post_detail shows the top 4, or posts sharing tags if none
+        tag_similar = self.tag_similar(posts, post_data)
+        similar = {post.id: similar.get(post.id, tag_similar[post.id])[:4]
+                   for post in posts}
+
+        # the sidebar appears on every page
+        sidebar = digest(
+            [(post.id, post.title)
+             for post in show_latest_posts(3)['latest_posts']],
+            [(post.id, post.title)
+             for post in get_most_commented_posts()],
+            [(post.id, post.title) for post in get_most_read_posts(3)])
+
+        pages = {}
+        home = reverse('blog:homepage')
+        pages[output_path(home)] = (home, sidebar)
+
+        for post in posts:
+            url = post.get_absolute_url()
+            pages[output_path(url)] = (url, digest(sidebar,
+                                                   post_data[post.id],
+                                                   post.title,
+                                                   similar[post.id]))
+
+        self.add_list_pages(pages, reverse('blog:post_list'), posts,
+                            post_data, sidebar)
+        for tag in Tag.objects.filter(
+                slug__in={slug for data in post_data.values()
+                          for slug in data[3]}):
+            tagged = [post for post in posts
+                      if tag.slug in post_data[post.id][3]]
+            self.add_list_pages(pages,
+                                reverse('blog:post_list_by_tag',
+                                        args=[tag.slug]),
+                                tagged, post_data, (sidebar, tag.name))
+
+        sitemap = '/sitemap.xml'
+        pages[output_path(sitemap)] = (sitemap, digest(
+            [(post.id, post_data[post.id][0]) for post in posts]))
+        return pages
+
+    def tag_similar(self, posts, post_data):
+        """
+        Returns {post id: [(id, title)]} of the posts sharing its tags.
+
+        This is post_detail's fallback when a post has no recommendations:
+        posts sharing the most tags first, then the newest.
+        """
+
+        # posts are newest first
+        order = {post.id: index for index, post in enumerate(posts)}
+        titles = {post.id: post.title for post in posts}
+        tagged = {}
+        for post in posts:
+            for slug in post_data[post.id][3]:
+                tagged.setdefault(slug, []).append(post.id)
+
+        similar = {}
+        for post in posts:
+            shared = Counter(other for slug in post_data[post.id][3]
+                             for other in tagged[slug] if other != post.id)
+            best = sorted(shared, key=lambda other: (-shared[other],
+                                                     order[other]))[:4]
+            similar[post.id] = [(other, titles[other]) for other in best]
+        return similar
+
+    def add_list_pages(self, pages, url, posts, post_data, context):
+        """Adds every page of a paginated post list."""
+
+        paginator = Paginator(posts, POSTS_PER_PAGE)
+        for number in paginator.page_range:
+            page = paginator.page(number)
+            page_url = url if number == 1 else f'{url}?page={number}'
+            pages[output_path(url, number)] = (page_url, digest(
+                context, paginator.num_pages,
+                [(post.id, post.title, post_data[post.id])
+                 for post in page]))
@@ -0,0 +1,42 @@
+import time
+from django.core.management.base import BaseCommand
+from blog.counters import flush_views, refresh_trending
+
+
+class Command(BaseCommand):
+    """
+    Flushes buffered post views to the database.
+
+    Views recorded by post_detail are buffered in the cache and written
+    here in batched upserts to the daily rollups, after which the
+    rankings of the posts that were read are refreshed.
+    Run it from cron or with --loop.
+    """
+
+    help = 'Writes buffered post view counts to the database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running and flush every --interval '
+                                 'seconds.')
+        parser.add_argument('--interval', type=float, default=60,
+                            help='Number of seconds between flushes in loop '
+                                 'mode.')
+        parser.add_argument('--refresh-trending', action='store_true',
+                            help='Also recompute trending counts for all '
+                                 'ranked posts (run daily).')
+
+    def handle(self, *args, **options):
+        while True:
+            flushed = flush_views()
+            if flushed is None:
+                self.stdout.write('Another flush is in progress, skipping.')
+            elif flushed:
+                self.stdout.write(f'Flushed {flushed} views.')
+
+            if options['refresh_trending']:
+                refresh_trending()
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,130 @@
+import gzip
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from blog.partitions import (TABLE, add_months, create_partition,
+                             detach_partition, is_partitioned, month_start,
+                             monthly_partitions, rebuild_table)
+
+
+class Command(BaseCommand):
+    """
+    Maintains the monthly partitions of the comment table.
+
+    Creates the partitions of the current month and of the next
+    --ahead months, so new comments never land in the default partition.
+    Run it from cron, e.g. daily.
+
+    With --retention, partitions older than that many months are
+    detached. A detached partition is no longer seen by queries,
+    including Post.comments, the sidebar and the admin, and loses its
+    foreign key to the posts. Unless --detach-only is given, each
+    detached partition is then written to <archive dir>/<partition>.csv.gz
+    and dropped.
+
+    With --convert, an existing unpartitioned comment table is converted
+    first. This is what migration 0021 does when BLOG_COMMENT_PARTITIONING
+    is set. Requires PostgreSQL.
+    """
+
+    help = 'Creates future comment partitions and archives old ones.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int,
+                            default=getattr(settings,
+                                            'BLOG_COMMENT_PARTITIONS_AHEAD',
+                                            3),
+                            help='Number of future months to create '
+                                 'partitions for.')
+        parser.add_argument('--retention', type=int,
+                            default=getattr(settings,
+                                            'BLOG_COMMENT_RETENTION_MONTHS',
+                                            None),
+                            help='Number of months of comments to keep '
+                                 'attached.')
+        parser.add_argument('--archive-dir',
+                            default=getattr(settings,
+                                            'BLOG_COMMENT_ARCHIVE_DIR',
+                                            settings.BASE_DIR
+                                            / 'comment_archive'),
+                            help='Directory to write archived partitions to.')
+        parser.add_argument('--detach-only', action='store_true',
+                            help='Keep old partitions as standalone tables '
+                                 'instead of archiving and dropping them.')
+        parser.add_argument('--convert', action='store_true',
+                            help='Convert an unpartitioned comment table '
+                                 'first.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Comment partitions require PostgreSQL.')
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            if not is_partitioned(cursor):
+                if not options['convert']:
+                    raise CommandError(f'{TABLE} is not partitioned, run '
+                                       f'with --convert to convert it.')
+                rebuild_table(cursor, partitioned=True,
+                              months_ahead=options['ahead'])
+                self.stdout.write(f'Converted {TABLE} to partitions.')
+
+        self.create_partitions(options['ahead'])
+        if options['retention'] is not None:
+            self.archive_partitions(options['retention'],
+                                    Path(options['archive_dir']),
+                                    options['detach_only'])
+
+    def create_partitions(self, ahead):
+        """Creates the missing partitions up to `ahead` months from now."""
+
+        now = month_start(datetime.now(timezone.utc))
+        for offset in range(ahead + 1):
+            month = add_months(now, offset)
+            # one transaction per partition keeps the locks short
+            with transaction.atomic(), connection.cursor() as cursor:
+                if month not in monthly_partitions(cursor):
+                    name = create_partition(cursor, month)
+                    self.stdout.write(f'Created {name}')
+
+    def archive_partitions(self, retention, archive_dir, detach_only):
+        """Detaches, and archives, partitions older than `retention` months."""
+
+        cutoff = add_months(month_start(datetime.now(timezone.utc)),
+                            -retention)
+        with connection.cursor() as cursor:
+            old = sorted((month, name) for month, name
+                         in monthly_partitions(cursor).items()
+                         if month < cutoff)
+
+        for month, name in old:
+            with transaction.atomic(), connection.cursor() as cursor:
+                detach_partition(cursor, name)
+            if detach_only:
+                self.stdout.write(f'Detached {name}')
+                continue
+
+            path = archive_dir / f'{name}.csv.gz'
+            rows = self.archive(name, path)
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(f'DROP TABLE {name}')
+            self.stdout.write(f'Archived {name} ({rows} comments) to {path}')
+
+    def archive(self, name, path):
+        """Writes a table as gzipped CSV and returns its number of rows."""
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = path.with_name(f'.{path.name}.tmp')
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {name}')
+            rows = cursor.fetchone()[0]
+            with gzip.open(temporary, 'wb') as archive:
+                cursor.copy_expert(f'COPY {name} TO STDOUT '
+                                   f'WITH (FORMAT csv, HEADER)', archive)
+            # the table is only dropped once the archive is on disk
+            with open(temporary, 'rb') as archive:
+                os.fsync(archive.fileno())
+        os.replace(temporary, path)
+        return rows
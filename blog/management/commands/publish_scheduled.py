@@ -0,0 +1,65 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from blog.models import Post
+
+
+class Command(BaseCommand):
+    """
+    Publishes scheduled posts whose publish date has arrived.
+
+    Run it once (e.g. from cron) or with --loop to keep it running.
+    In loop mode the command sleeps until the next scheduled publish
+    date, or at most --interval seconds, so posts go live on time.
+
+    Publishing goes through Post.save(), which sends the post_published
+    signal that invalidates cached pages, counters and the sitemap.
+    """
+
+    help = 'Publishes scheduled posts whose publish date has passed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running and publish posts as they '
+                                 'become due.')
+        parser.add_argument('--interval', type=float, default=60,
+                            help='Maximum number of seconds to sleep between '
+                                 'checks in loop mode.')
+
+    def handle(self, *args, **options):
+        while True:
+            published = self.publish_due_posts()
+            for post in published:
+                self.stdout.write(f'Published "{post}" ({post.publish})')
+
+            if not options['loop']:
+                break
+            time.sleep(self.seconds_until_next(options['interval']))
+
+    def publish_due_posts(self):
+        """Publishes all due scheduled posts and returns them."""
+
+        published = []
+        with transaction.atomic():
+            # skip rows locked by another scheduler process
+            due = Post.objects.select_for_update(skip_locked=True).filter(
+                status=Post.Status.SCHEDULED,
+                publish__lte=timezone.now())
+            for post in due:
+                post.status = Post.Status.PUBLISHED
+                post.save(update_fields=['status', 'updated'])
+                published.append(post)
+        return published
+
+    def seconds_until_next(self, interval):
+        """Returns how long to sleep before the next post becomes due."""
+
+        next_publish = Post.objects.filter(status=Post.Status.SCHEDULED)\
+                                   .order_by('publish')\
+                                   .values_list('publish', flat=True)\
+                                   .first()
+        if next_publish is None:
+            return interval
+        wait = (next_publish - timezone.now()).total_seconds()
+        return min(max(wait, 0), interval)
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from blog.search import get_search_backend
+
+
+class Command(BaseCommand):
+    """
+    Rebuilds the search index from the posts table.
+
+    Backends keeping an index of their own, like SQLite FTS5, update it
+    from the Post signals, which writes bypassing signals do not send:
+    QuerySet.update(), bulk_create() and raw SQL. Run this command after
+    such writes, or whenever search results look out of date.
+    """
+
+    help = 'Rebuilds the full-text search index of the posts.'
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        if not backend.keeps_index:
+            self.stdout.write(f'{type(backend).__name__} searches the posts '
+                              f'table directly, there is no index to '
+                              f'rebuild.')
+            return
+
+        with transaction.atomic():
+            backend.rebuild()
+        self.stdout.write('Rebuilt the search index.')
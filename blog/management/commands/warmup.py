@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from blog.warmup import warm_up
+
+
+class Command(BaseCommand):
+    """
+    Renders the most requested pages so caches are warm after a deploy.
+
+    Run it before a new release takes traffic, or set BLOG_WARMUP=1 in
+    the environment to warm up every worker as it starts.
+    """
+
+    help = 'Pre-renders the homepage, listing pages and top posts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--list-pages', type=int,
+                            help='Number of post list pages to render.')
+        parser.add_argument('--top-posts', type=int,
+                            help='Number of most read posts to render.')
+
+    def handle(self, *args, **options):
+        for url, status in warm_up(options['list_pages'],
+                                   options['top_posts']):
+            self.stdout.write(f'{status} {url}')
@@ -0,0 +1,192 @@
+import re
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.urls import resolve, Resolver404
+from django.utils.http import urlencode
+from .surrogate import add_surrogate_keys
+
+# views whose successful responses are kept for serve-stale mode
+DEFAULT_STALE_VIEWS = [
+    'blog:homepage',
+    'blog:post_list',
+    'blog:post_list_by_tag',
+    'blog:post_detail',
+    'django.contrib.sitemaps.views.sitemap',
+]
+
+# CSRF tokens rendered into forms, which belong to a single visitor
+CSRF_TOKEN_RE = re.compile(rb'(name="csrfmiddlewaretoken" value=")[^"]*(")')
+CSRF_PLACEHOLDER = rb'\1__blog_csrf_token__\2'
+
+
+class LoadSheddingMiddleware:
+    """
+    Admission control for blog views.
+
+    Limits the number of requests each view processes concurrently.
+    Requests that cannot be admitted within BLOG_ADMISSION_TIMEOUT seconds
+    are shed: read views serve their last good (stale) response if one is
+    cached, everything else gets a 503 with a Retry-After header.
+
+    Read views also serve stale responses when the database raises an error,
+    or while the view's average response time is above BLOG_SLOW_THRESHOLD
+    seconds. In the slow case a single request per view is still let
+    through to refresh the cached response and the timing average.
+
+    Settings:
+        - `BLOG_CONCURRENCY_LIMITS`: A dict mapping view names to limits.
+        - `BLOG_DEFAULT_CONCURRENCY_LIMIT`: Limit for views not listed above.
+        - `BLOG_STALE_VIEWS`: View names whose responses may be served stale.
+        - `BLOG_STALE_TIMEOUT`: How long stale responses are kept in the cache.
+        - `BLOG_STALE_REFRESH`: Minimum seconds between two writes of a
+          view's stale response.
+        - `BLOG_STALE_PARAMS`: Query parameters that select a different
+          stale response; other parameters are ignored.
+
+    Stored responses have their CSRF tokens replaced by a placeholder,
+    which is filled in with the current visitor's token when served, and
+    keep their surrogate keys so proxies can still purge them.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.limits = getattr(settings, 'BLOG_CONCURRENCY_LIMITS', {})
+        self.default_limit = getattr(settings,
+                                     'BLOG_DEFAULT_CONCURRENCY_LIMIT', 10)
+        self.admission_timeout = getattr(settings,
+                                         'BLOG_ADMISSION_TIMEOUT', 0.5)
+        self.slow_threshold = getattr(settings, 'BLOG_SLOW_THRESHOLD', 2.0)
+        self.stale_views = set(getattr(settings, 'BLOG_STALE_VIEWS',
+                                       DEFAULT_STALE_VIEWS))
+        self.stale_timeout = getattr(settings, 'BLOG_STALE_TIMEOUT',
+                                     60 * 60 * 24)
+        self.stale_refresh = getattr(settings, 'BLOG_STALE_REFRESH', 60)
+        self.stale_params = getattr(settings, 'BLOG_STALE_PARAMS',
+                                    ['page', 'p'])
+        self.lock = threading.Lock()
+        self.semaphores = {}
+        self.probes = {}
+        # exponentially weighted moving average of each view's duration
+        self.timings = {}
+
+    def __call__(self, request):
+        try:
+            view_name = resolve(request.path_info).view_name
+        except Resolver404:
+            return self.get_response(request)
+
+        can_serve_stale = (request.method in ('GET', 'HEAD')
+                           and view_name in self.stale_views)
+
+        # database is slow: let one request through to refresh,
+        # serve everyone else the stale response
+        probe = None
+        if can_serve_stale and self.is_slow(view_name):
+            probe = self.get_lock(self.probes, view_name, 1)
+            if not probe.acquire(blocking=False):
+                probe = None
+                stale = self.get_stale(request)
+                if stale is not None:
+                    return stale
+
+        try:
+            semaphore = self.get_lock(self.semaphores, view_name,
+                                      self.limits.get(view_name,
+                                                      self.default_limit))
+            if not semaphore.acquire(timeout=self.admission_timeout):
+                stale = self.get_stale(request) if can_serve_stale else None
+                return stale if stale is not None else self.unavailable()
+
+            try:
+                return self.process(request, view_name, can_serve_stale)
+            finally:
+                semaphore.release()
+        finally:
+            if probe is not None:
+                probe.release()
+
+    def process(self, request, view_name, can_serve_stale):
+        """Runs the view, recording its duration and caching its response."""
+
+        request.blog_can_serve_stale = can_serve_stale
+        start = time.monotonic()
+        response = self.get_response(request)
+        self.record_timing(view_name, time.monotonic() - start)
+
+        # views turn it off for responses not worth a stale copy
+        if (request.blog_can_serve_stale and response.status_code == 200
+                and not response.streaming
+                and not getattr(response, 'blog_stale', False)
+                and not (hasattr(request, 'user')
+                         and request.user.is_authenticated)):
+            self.set_stale(request, response)
+        return response
+
+    def process_exception(self, request, exception):
+        # serve the last good response when the database fails
+        if (isinstance(exception, DatabaseError)
+                and getattr(request, 'blog_can_serve_stale', False)):
+            return self.get_stale(request)
+        return None
+
+    def get_lock(self, registry, view_name, limit):
+        """Returns the semaphore for a view, creating it if needed."""
+
+        with self.lock:
+            if view_name not in registry:
+                registry[view_name] = threading.BoundedSemaphore(limit)
+            return registry[view_name]
+
+    def record_timing(self, view_name, duration):
+        with self.lock:
+            average = self.timings.get(view_name, duration)
+            self.timings[view_name] = 0.8 * average + 0.2 * duration
+
+    def is_slow(self, view_name):
+        return self.timings.get(view_name, 0) > self.slow_threshold
+
+    def stale_key(self, request):
+        # other query parameters would let any URL variant take a copy
+        params = urlencode(sorted((name, value) for name in self.stale_params
+                                  for value in request.GET.getlist(name)))
+        return f'blog:stale:{request.path}?{params}'
+
+    def get_stale(self, request):
+        """Returns the cached stale response for a request, or None."""
+
+        cached = cache.get(self.stale_key(request))
+        if cached is None:
+            return None
+
+        content, content_type, keys = cached
+        add_surrogate_keys(request, *keys)
+        if b'__blog_csrf_token__' in content:
+            # sets the visitor's CSRF cookie, like {% csrf_token %} does
+            content = content.replace(b'__blog_csrf_token__',
+                                      get_token(request).encode())
+        response = HttpResponse(content, content_type=content_type)
+        response['X-Blog-Stale'] = '1'
+        response.blog_stale = True
+        return response
+
+    def set_stale(self, request, response):
+        key = self.stale_key(request)
+        # store a page at most once per BLOG_STALE_REFRESH seconds
+        if not cache.add(f'{key}:fresh', 1, timeout=self.stale_refresh):
+            return
+        content = CSRF_TOKEN_RE.sub(CSRF_PLACEHOLDER, response.content)
+        keys = sorted(getattr(request, 'surrogate_keys', ()))
+        cache.set(key, (content, response.get('Content-Type'), keys),
+                  timeout=self.stale_timeout)
+
+    def unavailable(self):
+        response = HttpResponse('The blog is busy right now. '
+                                'Please try again shortly.',
+                                status=503)
+        response['Retry-After'] = '5'
+        return response
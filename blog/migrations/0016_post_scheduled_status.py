@@ -0,0 +1,18 @@
+# Generated by Django 4.2.5 on 2026-10-19 19:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0015_alter_post_thumbnail'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='post',
+            name='status',
+            field=models.CharField(choices=[('DF', 'Draft'), ('PB', 'Published'), ('SC', 'Scheduled')], default='DF', max_length=2),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.5 on 2026-10-19 19:28
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0016_post_scheduled_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostRanking',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ranking', serialize=False, to='blog.post')),
+                ('total_views', models.PositiveIntegerField(default=0)),
+                ('trending_views', models.PositiveIntegerField(default=0)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-total_views'],
+                'indexes': [models.Index(fields=['-total_views'], name='blog_postra_total_v_59054c_idx'), models.Index(fields=['-trending_views'], name='blog_postra_trendin_f359ed_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PostViewDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('views', models.PositiveIntegerField(default=0)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_views', to='blog.post')),
+            ],
+            options={
+                'ordering': ['-date'],
+                'indexes': [models.Index(fields=['date'], name='blog_postvi_date_20328f_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='postviewdaily',
+            constraint=models.UniqueConstraint(fields=('post', 'date'), name='unique_post_view_date'),
+        ),
+    ]
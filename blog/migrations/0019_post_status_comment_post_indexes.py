@@ -0,0 +1,21 @@
+# Generated by Django 4.2.5 on 2026-10-19 19:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0018_similar_post'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'active', 'created'], name='blog_commen_post_id_6ee5ee_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['status', '-publish'], name='blog_post_status_bb6f7a_idx'),
+        ),
+    ]
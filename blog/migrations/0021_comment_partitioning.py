@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.db import migrations
+from blog.partitions import is_partitioned, rebuild_table
+
+
+def enabled(schema_editor):
+    return (schema_editor.connection.vendor == 'postgresql'
+            and getattr(settings, 'BLOG_COMMENT_PARTITIONING', False))
+
+
+def partition_comments(apps, schema_editor):
+    """Converts blog_comment to monthly range partitions on created."""
+
+    if not enabled(schema_editor):
+        return
+    with schema_editor.connection.cursor() as cursor:
+        if not is_partitioned(cursor):
+            rebuild_table(cursor, partitioned=True,
+                          months_ahead=getattr(
+                              settings, 'BLOG_COMMENT_PARTITIONS_AHEAD', 3))
+
+
+def unpartition_comments(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        if is_partitioned(cursor):
+            rebuild_table(cursor, partitioned=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0020_post_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_comments, unpartition_comments),
+    ]
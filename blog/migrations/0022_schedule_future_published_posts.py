@@ -0,0 +1,22 @@
+from django.db import migrations
+from django.utils import timezone
+
+
+def schedule_future_posts(apps, schema_editor):
+    """Hides published posts with a future publish date until it arrives."""
+
+    Post = apps.get_model('blog', 'Post')
+    Post.objects.filter(status='PB', publish__gt=timezone.now())\
+                .update(status='SC')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0021_comment_partitioning'),
+    ]
+
+    operations = [
+        migrations.RunPython(schedule_future_posts,
+                             migrations.RunPython.noop),
+    ]
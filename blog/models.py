@@ -10,6 +10,8 @@ class Post(models.Model):
     class Status(models.TextChoices):  # enum class
         DRAFT = 'DF', 'Draft'
         PUBLISHED = 'PB', 'Published'
+        # published automatically at the publish date by `publish_scheduled`
+        SCHEDULED = 'SC', 'Scheduled'
 
     title = models.CharField(max_length=250)
     slug = models.SlugField(max_length=250,
@@ -33,11 +35,28 @@ class Post(models.Model):
         # sort query results by publish date
         ordering = ['-publish']
         # index query results on publish date for efficient retrieval
-        indexes = [models.Index(fields=['-publish']), ]
+        indexes = [models.Index(fields=['-publish']),
+                   # published posts, newest first (lists, sitemap, sidebar)
+                   models.Index(fields=['status', '-publish']), ]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # status as loaded, used to detect publishing and unpublishing
+        self._loaded_status = self.__dict__.get('status')
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        # posts published with a future date are held back until then,
+        # so read paths only need to filter on status
+        if (self.status == self.Status.PUBLISHED
+                and self.publish > timezone.now()):
+            self.status = self.Status.SCHEDULED
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'status'}
+        super().save(*args, **kwargs)
+
     def get_absolute_url(self):
         """Returns the absolute URL of the post detail view for this post."""
 
@@ -49,6 +68,8 @@ class Post(models.Model):
 
 
 class Comment(models.Model):
+    # With BLOG_COMMENT_PARTITIONING, the table is stored in monthly
+    # PostgreSQL partitions on `created`, see blog/partitions.py
 
     post = models.ForeignKey(Post,
                              on_delete=models.CASCADE,
@@ -66,8 +87,82 @@ class Comment(models.Model):
         ordering = ['created']
         # index query results on created date for efficient retrieval
         indexes = [
-            models.Index(fields=['created'])
+            models.Index(fields=['created']),
+            # a post's active comments in display order (post_detail)
+            models.Index(fields=['post', 'active', 'created']),
         ]
 
     def __str__(self):
         return f'Comment by {self.name} on {self.post}'
+
+
+class PostViewDaily(models.Model):
+    """Daily rollup of a post's views, written by `flush_post_views`."""
+
+    post = models.ForeignKey(Post,
+                             on_delete=models.CASCADE,
+                             related_name='daily_views')
+    date = models.DateField()
+    views = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-date']
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'date'],
+                                    name='unique_post_view_date'),
+        ]
+        # index rollups on date for trending window sums
+        indexes = [models.Index(fields=['date'])]
+
+    def __str__(self):
+        return f'{self.views} views of {self.post} on {self.date}'
+
+
+class PostRanking(models.Model):
+    """Precomputed view totals used to rank posts by readership."""
+
+    post = models.OneToOneField(Post,
+                                on_delete=models.CASCADE,
+                                primary_key=True,
+                                related_name='ranking')
+    total_views = models.PositiveIntegerField(default=0)
+    # views within the last BLOG_TRENDING_DAYS days
+    trending_views = models.PositiveIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-total_views']
+        indexes = [
+            models.Index(fields=['-total_views']),
+            models.Index(fields=['-trending_views']),
+        ]
+
+    def __str__(self):
+        return f'Ranking of {self.post}'
+
+
+class SimilarPost(models.Model):
+    """A precomputed "more like this" recommendation for a post."""
+
+    post = models.ForeignKey(Post,
+                             on_delete=models.CASCADE,
+                             related_name='similarities')
+    similar = models.ForeignKey(Post,
+                                on_delete=models.CASCADE,
+                                related_name='+')
+    # cosine similarity of the posts' TF-IDF vectors
+    score = models.FloatField()
+    # start of the `build_similar_posts` run that computed this row
+    computed = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-score']
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'similar'],
+                                    name='unique_similar_post'),
+        ]
+        # index on post and score so post_detail reads the top rows directly
+        indexes = [models.Index(fields=['post', '-score'])]
+
+    def __str__(self):
+        return f'{self.similar} is similar to {self.post}'
@@ -0,0 +1,155 @@
+import re
+from datetime import datetime, timezone
+
+TABLE = 'blog_comment'
+DEFAULT_PARTITION = f'{TABLE}_default'
+
+# monthly partitions are named blog_comment_p<year>_<month>
+PARTITION_RE = re.compile(rf'^{TABLE}_p(\d{{4}})_(\d{{2}})$')
+
+
+def month_start(moment):
+    """Returns midnight UTC on the first day of the month of `moment`."""
+
+    moment = moment.astimezone(timezone.utc)
+    return datetime(moment.year, moment.month, 1, tzinfo=timezone.utc)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def partition_name(month):
+    return f'{TABLE}_p{month.year:04d}_{month.month:02d}'
+
+
+def is_partitioned(cursor):
+    cursor.execute('SELECT relkind FROM pg_class '
+                   'WHERE oid = to_regclass(%s)', [TABLE])
+    row = cursor.fetchone()
+    return row is not None and row[0] == 'p'
+
+
+def monthly_partitions(cursor):
+    """Returns {month: partition name} for the attached monthly partitions."""
+
+    cursor.execute('SELECT c.relname FROM pg_inherits i '
+                   'JOIN pg_class c ON c.oid = i.inhrelid '
+                   'WHERE i.inhparent = to_regclass(%s)', [TABLE])
+    partitions = {}
+    for (name,) in cursor.fetchall():
+        match = PARTITION_RE.match(name)
+        if match:
+            month = datetime(int(match[1]), int(match[2]), 1,
+                             tzinfo=timezone.utc)
+            partitions[month] = name
+    return partitions
+
+
+def create_partition(cursor, month):
+    """
+    Creates and attaches the partition of a month.
+
+    Rows of that month already in the default partition are moved into
+    the new partition first, otherwise attaching it would fail.
+    """
+
+    name = partition_name(month)
+    lower, upper = month, add_months(month, 1)
+    cursor.execute(f'CREATE TABLE {name} (LIKE {TABLE})')
+    cursor.execute(f'WITH moved AS (DELETE FROM {DEFAULT_PARTITION} '
+                   f'WHERE created >= %s AND created < %s RETURNING *) '
+                   f'INSERT INTO {name} SELECT * FROM moved', [lower, upper])
+    # bounds must be literals, not parameters
+    cursor.execute(f"ALTER TABLE {TABLE} ATTACH PARTITION {name} "
+                   f"FOR VALUES FROM ('{lower.isoformat()}') "
+                   f"TO ('{upper.isoformat()}')")
+    return name
+
+
+def detach_partition(cursor, name):
+    """
+    Detaches a partition and drops its ties to the comment table.
+
+    Django cascades post deletions through the partitioned table only,
+    so a detached table keeping its post_id foreign key would make
+    deleting a post with old comments fail. Its id default would keep
+    the comment table's sequence from being dropped.
+    """
+
+    cursor.execute(f'ALTER TABLE {TABLE} DETACH PARTITION {name}')
+    cursor.execute(f'ALTER TABLE {name} ALTER COLUMN id DROP DEFAULT')
+    cursor.execute("SELECT conname FROM pg_constraint "
+                   "WHERE conrelid = to_regclass(%s) AND contype = 'f'",
+                   [name])
+    for (constraint,) in cursor.fetchall():
+        cursor.execute(f'ALTER TABLE {name} DROP CONSTRAINT {constraint}')
+
+
+def table_definition(cursor):
+    """Returns the foreign key and index definitions of the comment table."""
+
+    cursor.execute("SELECT conname, pg_get_constraintdef(oid) "
+                   "FROM pg_constraint "
+                   "WHERE conrelid = to_regclass(%s) AND contype = 'f'",
+                   [TABLE])
+    foreign_keys = cursor.fetchall()
+    # indexes backing constraints are recreated with the constraints
+    cursor.execute('SELECT pg_get_indexdef(i.indexrelid) FROM pg_index i '
+                   'WHERE i.indrelid = to_regclass(%s) AND NOT EXISTS ('
+                   'SELECT 1 FROM pg_constraint c '
+                   'WHERE c.conindid = i.indexrelid)', [TABLE])
+    indexes = [definition for (definition,) in cursor.fetchall()]
+    return foreign_keys, indexes
+
+
+def rebuild_table(cursor, partitioned, months_ahead=3):
+    """
+    Copies the comment table into a partitioned or a regular table.
+
+    A partitioned table gets a partition for every month from the oldest
+    comment to `months_ahead` months from now, and a default partition.
+    Partitioned tables can only enforce unique constraints that include
+    the partition key, so their primary key becomes (id, created); ids
+    stay unique as they all come from the same sequence.
+    """
+
+    foreign_keys, indexes = table_definition(cursor)
+    old_table = f'{TABLE}_old'
+    cursor.execute(f'ALTER TABLE {TABLE} RENAME TO {old_table}')
+
+    if partitioned:
+        cursor.execute(f'CREATE TABLE {TABLE} (LIKE {old_table}) '
+                       f'PARTITION BY RANGE (created)')
+        cursor.execute(f'CREATE TABLE {DEFAULT_PARTITION} '
+                       f'PARTITION OF {TABLE} DEFAULT')
+        cursor.execute(f'SELECT MIN(created) FROM {old_table}')
+        oldest = cursor.fetchone()[0]
+        now = month_start(datetime.now(timezone.utc))
+        month = month_start(oldest) if oldest else now
+        while month <= add_months(now, months_ahead):
+            create_partition(cursor, month)
+            month = add_months(month, 1)
+    else:
+        cursor.execute(f'CREATE TABLE {TABLE} (LIKE {old_table})')
+
+    cursor.execute(f'INSERT INTO {TABLE} SELECT * FROM {old_table}')
+    # also drops the old id sequence and frees the constraint names;
+    # the new table only has the id default set below
+    cursor.execute(f'DROP TABLE {old_table}')
+
+    primary_key = '(id, created)' if partitioned else '(id)'
+    cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey '
+                   f'PRIMARY KEY {primary_key}')
+    for name, definition in foreign_keys:
+        cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {name} '
+                       f'{definition}')
+    for definition in indexes:
+        cursor.execute(definition)
+
+    cursor.execute(f'CREATE SEQUENCE {TABLE}_id_seq OWNED BY {TABLE}.id')
+    cursor.execute(f"ALTER TABLE {TABLE} ALTER COLUMN id "
+                   f"SET DEFAULT nextval('{TABLE}_id_seq')")
+    cursor.execute(f"SELECT setval('{TABLE}_id_seq', "
+                   f"COALESCE(MAX(id), 0) + 1, false) FROM {TABLE}")
@@ -0,0 +1,91 @@
+import atexit
+import logging
+import threading
+import urllib.request
+from django.conf import settings
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+# maximum number of keys sent in a single purge request
+MAX_KEYS_PER_REQUEST = 256
+
+# keys waiting to be purged, and the timer that will send them
+_pending = set()
+_timer = None
+_lock = threading.Lock()
+
+
+def purge_keys(*keys):
+    """
+    Queues surrogate keys to be purged from the reverse proxy.
+
+    Keys are queued once the current transaction commits, deduplicated,
+    and sent in batches BLOG_PURGE_DELAY seconds later, so a burst of
+    changes results in a few purge requests. Keys still queued when the
+    process exits (e.g. a management command run from cron) are sent
+    before it ends. Does nothing unless BLOG_PURGE_URL is set.
+    """
+
+    if not getattr(settings, 'BLOG_PURGE_URL', None) or not keys:
+        return
+    transaction.on_commit(lambda: _queue(keys))
+
+
+def _queue(keys):
+    global _timer
+
+    with _lock:
+        _pending.update(keys)
+        if _timer is None:
+            _timer = threading.Timer(getattr(settings, 'BLOG_PURGE_DELAY', 1),
+                                     flush)
+            _timer.daemon = True
+            _timer.start()
+
+
+def flush():
+    """Sends all queued keys to the proxy now. Returns the keys sent."""
+
+    global _timer
+
+    with _lock:
+        keys = sorted(_pending)
+        _pending.clear()
+        if _timer is not None:
+            _timer.cancel()
+            _timer = None
+
+    for start in range(0, len(keys), MAX_KEYS_PER_REQUEST):
+        send(keys[start:start + MAX_KEYS_PER_REQUEST])
+    return keys
+
+
+# the timer thread is a daemon, so short-lived processes must flush
+# their queue themselves before exiting
+atexit.register(flush)
+
+
+def send(keys):
+    """
+    Sends a single purge request for the given keys.
+
+    The request method and header are configurable to suit the proxy:
+    Varnish with xkey expects `PURGE` with an `xkey` header, Fastly a
+    `POST` with a `Surrogate-Key` header.
+    """
+
+    url = settings.BLOG_PURGE_URL
+    request = urllib.request.Request(
+        url,
+        method=getattr(settings, 'BLOG_PURGE_METHOD', 'PURGE'),
+        headers={getattr(settings, 'BLOG_PURGE_HEADER', 'Surrogate-Key'):
+                 ' '.join(keys)})
+    try:
+        with urllib.request.urlopen(request,
+                                    timeout=getattr(settings,
+                                                    'BLOG_PURGE_TIMEOUT', 5)):
+            pass
+    except OSError:
+        # the proxy falls back to its TTLs, don't fail the change
+        logger.exception('Purging %d keys from %s failed', len(keys), url)
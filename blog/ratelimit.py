@@ -0,0 +1,102 @@
+import time
+from functools import wraps
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+# seconds in each period unit accepted by rate strings such as '5/m'
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 60 * 60 * 24}
+
+# default rates used when BLOG_RATE_LIMITS does not define a scope
+DEFAULT_RATES = {
+    'post_comment': '5/m',
+    'post_share': '3/m',
+}
+
+
+def parse_rate(rate):
+    """
+    Parses a rate string of the form '<requests>/<period>'.
+
+    Returns a (limit, period_in_seconds) tuple.
+    """
+
+    count, period = rate.split('/')
+    return int(count), PERIODS[period[0].lower()]
+
+
+def client_ip(request):
+    """
+    Returns the address used to identify the client making a request.
+
+    Behind a reverse proxy every request comes from the proxy's address;
+    with BLOG_TRUST_X_FORWARDED_FOR the last X-Forwarded-For address,
+    the one added by the proxy, is used instead. Earlier addresses are
+    sent by the client and cannot be trusted.
+    """
+
+    if getattr(settings, 'BLOG_TRUST_X_FORWARDED_FOR', False):
+        forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+        if forwarded:
+            return forwarded.split(',')[-1].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def count_request(scope, ident, rate):
+    """
+    Counts a request in the client's current window for the given scope.
+
+    Windows are fixed periods of the rate, counted in the cache backend so
+    that every worker shares them. `cache.add` and `cache.incr` are atomic,
+    so each request of a concurrent burst gets its own count.
+    Returns 0 if the request is allowed, otherwise the number of seconds
+    until the next window starts.
+    """
+
+    limit, period = parse_rate(rate)
+    now = time.time()
+    window = int(now // period)
+    key = f'blog:ratelimit:{scope}:{ident}:{window}'
+
+    if cache.add(key, 1, timeout=period + 1):
+        count = 1
+    else:
+        try:
+            count = cache.incr(key)
+        except ValueError:
+            # expired since the add, the window is over
+            cache.add(key, 1, timeout=period + 1)
+            count = 1
+
+    if count > limit:
+        return (window + 1) * period - now
+    return 0
+
+
+def ratelimit(scope, methods=('POST',)):
+    """
+    Decorator limiting the rate of requests a single client can make to a view.
+
+    The rate for `scope` is read from the BLOG_RATE_LIMITS setting,
+    falling back to DEFAULT_RATES. Only requests using one of `methods`
+    are counted. Clients over the limit get a 429 response.
+    """
+
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            rates = getattr(settings, 'BLOG_RATE_LIMITS', {})
+            rate = rates.get(scope, DEFAULT_RATES.get(scope))
+
+            if rate and request.method in methods:
+                wait = count_request(scope, client_ip(request), rate)
+                if wait:
+                    response = HttpResponse('Too many requests. '
+                                            'Please try again later.',
+                                            status=429)
+                    response['Retry-After'] = str(int(wait) + 1)
+                    return response
+
+            return view_func(request, *args, **kwargs)
+        return wrapper
+    return decorator
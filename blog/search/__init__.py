@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.db import connection
+from django.utils.module_loading import import_string
+
+# backends used when BLOG_SEARCH_BACKEND is not set, by database vendor
+DEFAULT_BACKENDS = {
+    'postgresql': 'blog.search.postgres.PostgresSearchBackend',
+    'sqlite': 'blog.search.sqlite.SQLiteSearchBackend',
+}
+
+_backend = None
+
+
+def get_search_backend():
+    """
+    Returns the search backend used by post_search.
+
+    The BLOG_SEARCH_BACKEND setting holds the dotted path of a
+    SearchBackend subclass; by default the backend matching the
+    database in use is chosen.
+    """
+
+    global _backend
+
+    if _backend is None:
+        path = getattr(settings, 'BLOG_SEARCH_BACKEND', None) \
+            or DEFAULT_BACKENDS[connection.vendor]
+        _backend = import_string(path)()
+    return _backend
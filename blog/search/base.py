@@ -0,0 +1,51 @@
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+# characters marking matches in snippets, replaced after escaping
+START, STOP = '\x02', '\x03'
+
+
+def highlight(snippet):
+    """Escapes a snippet and turns the START/STOP markers into <mark>s."""
+
+    return mark_safe(escape(snippet).replace(START, '<mark>')
+                                    .replace(STOP, '</mark>'))
+
+
+class SearchBackend:
+    """
+    Interface of the full-text search engines behind post_search.
+
+    Backends return published posts ranked by relevance, each with a
+    `rank` attribute (higher is more relevant) and a `snippet`
+    attribute holding safe HTML with the matched terms highlighted.
+    Backends keeping an index of their own update it from the Post
+    signals through `index_post()` and `remove_post()`.
+    """
+
+    # whether index_post() and remove_post() must be called on changes
+    keeps_index = False
+
+    def search(self, query, limit=50):
+        """Returns a list of published posts matching the query."""
+
+        raise NotImplementedError
+
+    def index_post(self, post, old=None):
+        """
+        Adds or updates a post in the index.
+
+        `old` holds the (title, body) previously indexed for the post,
+        or None for a new post.
+        """
+
+    def remove_post(self, post):
+        """Removes a deleted post from the index."""
+
+    def rebuild(self):
+        """
+        Rebuilds the whole index from the posts table.
+
+        Run by the `rebuild_search_index` command, after writes that
+        bypass the Post signals.
+        """
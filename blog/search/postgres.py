@@ -0,0 +1,32 @@
+from django.contrib.postgres.search import (SearchVector, SearchQuery,
+                                            SearchRank, SearchHeadline)
+from ..models import Post
+from .base import SearchBackend, START, STOP, highlight
+
+
+class PostgresSearchBackend(SearchBackend):
+    """
+    Full-text search with PostgreSQL's text search functions.
+
+    Posts are matched on title and body and ranked with SearchRank,
+    title matches weighing more than body matches. The vectors are
+    computed at query time, so there is no index to keep up to date.
+    """
+
+    def search(self, query, limit=50):
+        search_query = SearchQuery(query)
+        search_vector = (SearchVector('title', weight='A')
+                         + SearchVector('body', weight='B'))
+        posts = list(Post.objects.filter(status=Post.Status.PUBLISHED)
+                     .annotate(search=search_vector,
+                               rank=SearchRank(search_vector, search_query),
+                               snippet=SearchHeadline(
+                                   'body', search_query,
+                                   start_sel=START, stop_sel=STOP,
+                                   max_words=30, min_words=15))
+                     .filter(search=search_query)
+                     .order_by('-rank')[:limit])
+        # ts_headline returns the raw body: escape it, then mark matches
+        for post in posts:
+            post.snippet = highlight(post.snippet)
+        return posts
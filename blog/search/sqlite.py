@@ -0,0 +1,83 @@
+from django.db import connection
+from ..models import Post
+from .base import SearchBackend, START, STOP, highlight
+
+# full-text index over the title and body columns of blog_post
+INDEX_TABLE = 'blog_post_fts'
+
+
+def match_expression(query):
+    """
+    Turns user input into an FTS5 query matching all of its words.
+
+    Every word is quoted, so FTS5 operators and syntax in the input
+    are searched for literally instead of being interpreted.
+    """
+
+    words = query.split()
+    return ' '.join('"{}"'.format(word.replace('"', '""')) for word in words)
+
+
+class SQLiteSearchBackend(SearchBackend):
+    """
+    Full-text search with an SQLite FTS5 index.
+
+    The index is an external-content FTS5 table over blog_post (created
+    by migration 0020), so it stores only the index, not a copy of the
+    posts. Results are ranked with BM25, weighting title matches twice
+    as much as body matches, and snippets come from FTS5's snippet().
+    """
+
+    keeps_index = True
+
+    def search(self, query, limit=50):
+        expression = match_expression(query)
+        if not expression:
+            return []
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT {INDEX_TABLE}.rowid, "
+                f"bm25({INDEX_TABLE}, 2.0, 1.0), "
+                f"snippet({INDEX_TABLE}, 1, %s, %s, '…', 24) "
+                f"FROM {INDEX_TABLE} "
+                f"JOIN blog_post ON blog_post.id = {INDEX_TABLE}.rowid "
+                f"WHERE {INDEX_TABLE} MATCH %s AND blog_post.status = %s "
+                f"ORDER BY bm25({INDEX_TABLE}, 2.0, 1.0) LIMIT %s",
+                [START, STOP, expression, Post.Status.PUBLISHED, limit])
+            rows = cursor.fetchall()
+
+        posts = Post.objects.in_bulk([post_id for post_id, _, _ in rows])
+        results = []
+        for post_id, score, snippet in rows:
+            post = posts[post_id]
+            # bm25() is lower for better matches
+            post.rank = -score
+            post.snippet = highlight(snippet)
+            results.append(post)
+        return results
+
+    def index_post(self, post, old=None):
+        with connection.cursor() as cursor:
+            if old is not None:
+                self.delete_entry(cursor, post.id, *old)
+            cursor.execute(
+                f'INSERT INTO {INDEX_TABLE} (rowid, title, body) '
+                f'VALUES (%s, %s, %s)',
+                [post.id, post.title, post.body])
+
+    def remove_post(self, post):
+        with connection.cursor() as cursor:
+            self.delete_entry(cursor, post.id, post.title, post.body)
+
+    def delete_entry(self, cursor, post_id, title, body):
+        # external-content tables need the indexed values to delete a row
+        cursor.execute(
+            f"INSERT INTO {INDEX_TABLE} ({INDEX_TABLE}, rowid, title, body) "
+            f"VALUES ('delete', %s, %s, %s)",
+            [post_id, title, body])
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {INDEX_TABLE} ({INDEX_TABLE}) "
+                           f"VALUES ('rebuild')")
@@ -0,0 +1,119 @@
+from django.db.models.signals import (pre_save, post_save, post_delete,
+                                      m2m_changed)
+from django.db import transaction
+from django.dispatch import Signal, receiver
+from taggit.models import Tag
+from .caching import invalidate_content
+from .lookups import invalidate_lookups
+from .models import Post, Comment
+from .purge import purge_keys
+from .search import get_search_backend
+from .surrogate import (post_key, tag_key, POST_LIST_KEY, SIDEBAR_KEY,
+                        SITEMAP_KEY)
+
+# sent with the Post as `instance` when it becomes visible to readers
+post_published = Signal()
+
+# sent with the Post as `instance` when it stops being visible to readers
+post_unpublished = Signal()
+
+
+@receiver(post_save, sender=Post)
+def post_status_changed(sender, instance, created, **kwargs):
+    """Sends post_published/post_unpublished when a post's status changes."""
+
+    published = Post.Status.PUBLISHED
+    was_published = instance._loaded_status == published and not created
+    is_published = instance.status == published
+    instance._loaded_status = instance.status
+
+    if is_published and not was_published:
+        post_published.send(sender=Post, instance=instance)
+    elif was_published and not is_published:
+        post_unpublished.send(sender=Post, instance=instance)
+    elif is_published:
+        # an edit to a live post changes what readers see; readers must
+        # not re-cache the old data under the new version before commit
+        transaction.on_commit(invalidate_content)
+        # and may change its URL
+        transaction.on_commit(invalidate_lookups)
+        purge_post(instance)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    if instance.status == Post.Status.PUBLISHED:
+        post_unpublished.send(sender=Post, instance=instance)
+
+
+@receiver(post_published)
+@receiver(post_unpublished)
+def invalidate_published_content(sender, instance, **kwargs):
+    """Invalidates cached pages, sidebar fragments, counters and the sitemap."""
+
+    transaction.on_commit(invalidate_content)
+    transaction.on_commit(invalidate_lookups)
+    purge_post(instance)
+
+
+def purge_post(post):
+    """Purges proxy-cached responses showing a post or listing posts."""
+
+    purge_keys(post_key(post.id), POST_LIST_KEY, SIDEBAR_KEY, SITEMAP_KEY,
+               *(tag_key(slug) for slug in
+                 post.tags.values_list('slug', flat=True)))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def comment_changed(sender, instance, **kwargs):
+    # comment counts feed the "most commented" sidebar section, which is
+    # cached and kept by proxies for a few minutes only: invalidating or
+    # purging it would drop every cached fragment and page
+    purge_keys(post_key(instance.post_id))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tag_changed(sender, instance, **kwargs):
+    transaction.on_commit(invalidate_lookups)
+    purge_keys(tag_key(instance.slug))
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def post_tags_changed(sender, instance, action, model, pk_set, **kwargs):
+    """Purges a live post and the tag pages it was added to or removed from."""
+
+    if (action not in ('post_add', 'post_remove', 'post_clear')
+            or not isinstance(instance, Post)
+            or instance.status != Post.Status.PUBLISHED):
+        return
+
+    slugs = model.objects.filter(pk__in=pk_set or ())\
+                         .values_list('slug', flat=True)
+    purge_keys(post_key(instance.pk), *(tag_key(slug) for slug in slugs))
+
+
+@receiver(pre_save, sender=Post)
+def remember_indexed_text(sender, instance, **kwargs):
+    """Keeps the title and body in the search index, to replace them."""
+
+    if instance.pk and get_search_backend().keeps_index:
+        instance._indexed_text = Post.objects.filter(pk=instance.pk)\
+                                             .values_list('title', 'body')\
+                                             .first()
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, **kwargs):
+    backend = get_search_backend()
+    if backend.keeps_index:
+        backend.index_post(instance, getattr(instance, '_indexed_text', None))
+        instance._indexed_text = (instance.title, instance.body)
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, **kwargs):
+    backend = get_search_backend()
+    if backend.keeps_index:
+        backend.remove_post(instance)
@@ -0,0 +1,176 @@
+import re
+import numpy as np
+from scipy import sparse
+from django.db import transaction
+from django.utils import timezone
+from .models import Post, SimilarPost
+
+# words too common to say anything about a post's subject
+STOP_WORDS = frozenset('''
+a about after all also an and any are as at be because been but by can
+could did do does for from had has have how i if in into is it its just
+like more most my no not of on one only or other our out so some than
+that the their them then there these they this to up us was we were what
+when which who will with would you your
+'''.split())
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def tokenize(text):
+    """Splits text into lowercase word tokens, dropping stop words."""
+
+    return [token for token in TOKEN_RE.findall(text.lower())
+            if len(token) > 1 and token not in STOP_WORDS]
+
+
+def tfidf_matrix(documents):
+    """
+    Builds an L2-normalized sparse TF-IDF matrix, one row per document.
+
+    Term frequencies are sublinear (1 + log tf) and the IDF is smoothed,
+    so terms appearing in every document still get a small weight.
+    """
+
+    vocabulary = {}
+    rows, cols = [], []
+    for row, document in enumerate(documents):
+        for token in tokenize(document):
+            rows.append(row)
+            cols.append(vocabulary.setdefault(token, len(vocabulary)))
+
+    shape = (len(documents), max(len(vocabulary), 1))
+    counts = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)),
+                               shape=shape, dtype=np.float64)
+    # duplicate (row, col) entries are summed into term counts
+    counts.sum_duplicates()
+
+    counts.data = 1 + np.log(counts.data)
+    document_frequency = np.bincount(counts.indices, minlength=shape[1])
+    idf = np.log((1 + shape[0]) / (1 + document_frequency)) + 1
+    matrix = counts @ sparse.diags(idf)
+
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return sparse.csr_matrix(sparse.diags(1 / norms) @ matrix)
+
+
+def top_neighbours(matrix, rows, k, batch_size):
+    """
+    Yields (row, neighbour_rows, scores) for each of the given rows.
+
+    Cosine similarities are computed batch by batch, so memory use is
+    bounded by batch_size x number of documents.
+    """
+
+    transposed = matrix.T.tocsc()
+    for start in range(0, len(rows), batch_size):
+        batch = np.asarray(rows[start:start + batch_size])
+        scores = (matrix[batch] @ transposed).toarray()
+        # a post is not similar to itself
+        scores[np.arange(len(batch)), batch] = 0
+
+        count = min(k, scores.shape[1] - 1)
+        if count <= 0:
+            for row in batch:
+                yield row, [], []
+            continue
+
+        best = np.argpartition(-scores, count - 1, axis=1)[:, :count]
+        for i, row in enumerate(batch):
+            neighbours = best[i][np.argsort(-scores[i, best[i]])]
+            neighbours = neighbours[scores[i, neighbours] > 0]
+            yield row, neighbours, scores[i, neighbours]
+
+
+def build_similar_posts(k=4, batch_size=256, full=False):
+    """
+    Computes the top-k similar posts of published posts.
+
+    A full build scores every post. Otherwise only posts that are new or
+    were edited since the last build are scored against the whole corpus,
+    along with the existing posts whose neighbour lists they enter or
+    leave. Returns the number of posts whose recommendations were written.
+    """
+
+    started = timezone.now()
+    posts = list(Post.objects.filter(status=Post.Status.PUBLISHED)
+                             .order_by('id')
+                             .values_list('id', 'title', 'body', 'updated'))
+    ids = np.array([post[0] for post in posts], dtype=np.int64)
+    index = {post_id: row for row, post_id in enumerate(ids)}
+
+    # recommendations of and to posts that are no longer published
+    published_ids = ids.tolist()
+    stale = SimilarPost.objects.exclude(post_id__in=published_ids)\
+        | SimilarPost.objects.exclude(similar_id__in=published_ids)
+    affected_ids = set(stale.values_list('post_id', flat=True))
+    stale.delete()
+
+    if not posts:
+        return 0
+
+    # titles are weighted twice as much as the body
+    matrix = tfidf_matrix([f'{title} {title} {body}'
+                           for _, title, body, _ in posts])
+
+    last_build = SimilarPost.objects.order_by('-computed')\
+                                    .values_list('computed', flat=True)\
+                                    .first()
+    if full or last_build is None:
+        rows = list(range(len(posts)))
+    else:
+        changed = [row for row, post in enumerate(posts)
+                   if post[3] >= last_build]
+        rows = sorted(affected_rows(matrix, ids, index, changed,
+                                    affected_ids, k, batch_size))
+
+    with transaction.atomic():
+        SimilarPost.objects.filter(post_id__in=ids[rows].tolist()).delete()
+        SimilarPost.objects.bulk_create(
+            [SimilarPost(post_id=int(ids[row]),
+                         similar_id=int(ids[neighbour]),
+                         score=float(score),
+                         computed=started)
+             for row, neighbours, scores in top_neighbours(matrix, rows,
+                                                           k, batch_size)
+             for neighbour, score in zip(neighbours, scores)],
+            batch_size=1000)
+    return len(rows)
+
+
+def affected_rows(matrix, ids, index, changed, affected_ids, k, batch_size):
+    """
+    Returns the rows whose neighbour lists an incremental build must redo.
+
+    These are the changed posts themselves, posts that currently list a
+    changed post, and posts a changed post now scores high enough for.
+    """
+
+    rows = set(changed) | {index[post_id] for post_id in affected_ids
+                           if post_id in index}
+    if not changed:
+        return rows
+
+    changed_ids = ids[changed].tolist()
+    rows.update(index[post_id] for post_id in
+                SimilarPost.objects.filter(similar_id__in=changed_ids)
+                                   .values_list('post_id', flat=True)
+                if post_id in index)
+
+    # lowest stored score of each post with a full neighbour list
+    thresholds = np.zeros(len(ids))
+    stored = {}
+    for post_id, score in SimilarPost.objects.values_list('post_id', 'score'):
+        stored.setdefault(post_id, []).append(score)
+    for post_id, scores in stored.items():
+        if post_id in index and len(scores) >= k:
+            thresholds[index[post_id]] = min(scores)
+
+    transposed = matrix.T.tocsc()
+    for start in range(0, len(changed), batch_size):
+        batch = changed[start:start + batch_size]
+        scores = (matrix[batch] @ transposed).toarray()
+        scores[np.arange(len(batch)), batch] = 0
+        rows.update(np.nonzero((scores > thresholds).any(axis=0))[0].tolist())
+    return rows
@@ -0,0 +1,82 @@
+from functools import wraps
+from django.conf import settings
+
+# keys of content shared by many responses
+POST_LIST_KEY = 'post-list'
+SIDEBAR_KEY = 'sidebar'
+SITEMAP_KEY = 'sitemap'
+
+
+def post_key(post_id):
+    return f'post-{post_id}'
+
+
+def tag_key(slug):
+    return f'tag-{slug}'
+
+
+def add_surrogate_keys(request, *keys):
+    """Records content keys that the response to a request depends on."""
+
+    if not hasattr(request, 'surrogate_keys'):
+        request.surrogate_keys = set()
+    request.surrogate_keys.update(keys)
+
+
+def add_post_keys(request, posts):
+    """Records the keys of posts shown in a response, and of their tags."""
+
+    for post in posts:
+        add_surrogate_keys(request, post_key(post.id),
+                           *(tag_key(tag.slug) for tag in post.tags.all()))
+
+
+def surrogate_keys(*keys):
+    """Decorator adding fixed surrogate keys to a view's responses."""
+
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            add_surrogate_keys(request, *keys)
+            return view_func(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class SurrogateKeyMiddleware:
+    """
+    Adds Surrogate-Key and Cache-Tag headers to responses.
+
+    The headers list the posts, tags and shared fragments a response was
+    built from, so a reverse proxy or CDN can cache it and drop it when
+    one of them changes (see `blog.purge`). Every HTML page includes
+    the sidebar, so HTML responses always carry the sidebar key.
+
+    Comments are not purged from the sidebar's "most commented" list,
+    which would purge every page; instead successful HTML responses to
+    GET and HEAD requests get a Surrogate-Control max-age of
+    BLOG_EDGE_TTL seconds, bounding how long proxies show an outdated list.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        keys = set(getattr(request, 'surrogate_keys', ()))
+        if response.get('Content-Type', '').startswith('text/html'):
+            keys.add(SIDEBAR_KEY)
+            # not for errors, such as a 404 of a post being published,
+            # 429s or 503s, nor for responses to form posts
+            if (request.method in ('GET', 'HEAD')
+                    and response.status_code == 200
+                    and 'Surrogate-Control' not in response):
+                response['Surrogate-Control'] = \
+                    f"max-age={getattr(settings, 'BLOG_EDGE_TTL', 300)}"
+
+        if keys and 'Surrogate-Key' not in response:
+            keys = sorted(keys)
+            response['Surrogate-Key'] = ' '.join(keys)
+            response['Cache-Tag'] = ','.join(keys)
+        return response
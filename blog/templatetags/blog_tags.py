@@ -1,30 +1,56 @@
 from django import template
+from django.core.cache import cache
 from django.db.models import Count
 from django.utils.safestring import mark_safe
+from ..caching import versioned_key
 from ..models import Post
-import markdown
 
 register = template.Library()
 
 
 @register.simple_tag
 def total_posts():
-    return Post.objects.filter(status='PB').count()
+    return cache.get_or_set(
+        versioned_key('total_posts'),
+        lambda: Post.objects.filter(status='PB').count())
 
 
 @register.inclusion_tag('blog/post/latest_posts.html')
 def show_latest_posts(count=5):
-    latest_posts = Post.objects.filter(status='PB').order_by('-publish')[:count]
+    latest_posts = cache.get_or_set(
+        versioned_key('latest_posts', count),
+        lambda: list(Post.objects.filter(status='PB')
+                     .order_by('-publish')[:count]))
     return {'latest_posts': latest_posts}
 
 
 @register.simple_tag
 def get_most_commented_posts(count=5):
-    return Post.objects.filter(status='PB').annotate(
-        total_comments=Count('comments')
-    ).order_by('-total_comments')[:count]
+    # comments do not invalidate content, which would drop every cached
+    # fragment on each comment; a short timeout keeps the section current
+    return cache.get_or_set(
+        versioned_key('most_commented_posts', count),
+        lambda: list(Post.objects.filter(status='PB').annotate(
+            total_comments=Count('comments')
+        ).order_by('-total_comments')[:count]),
+        60 * 5)
+
+
+@register.simple_tag
+def get_most_read_posts(count=5, trending=False):
+    order = '-ranking__trending_views' if trending else '-ranking__total_views'
+    # rankings are refreshed by `flush_post_views`, so a short timeout
+    # keeps the section current without invalidating other content
+    return cache.get_or_set(
+        versioned_key('most_read_posts', count, trending),
+        lambda: list(Post.objects.filter(status='PB',
+                                         ranking__total_views__gt=0)
+                                 .order_by(order)[:count]),
+        60 * 5)
 
 
 @register.filter(name='markdown')
 def markdown_format(text):
+    # imported on first use to keep it out of worker startup
+    import markdown
     return mark_safe(markdown.markdown(text))
\ No newline at end of file
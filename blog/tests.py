@@ -1,3 +1,637 @@
-from django.test import TestCase
+import psycopg2
+import subprocess
+import sys
+import threading
+import time
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.test import (RequestFactory, SimpleTestCase, TestCase,
+                         override_settings)
+from django.utils import timezone
+from . import api, counters, lookups, purge, ratelimit
+from .cache_backends import Entry, LocalLRU, TwoTierCache
+from .caching import content_version
+from .db_backends.postgresql_pool.base import ConnectionPool
+from .management.commands import export_static
+from .models import Comment, Post, PostViewDaily
+from .search.postgres import PostgresSearchBackend
+from .search.sqlite import SQLiteSearchBackend
+from .surrogate import post_key, tag_key
+from .warmup import warm_up
 
-# Create your tests here.
+
+class PurgeHandler(BaseHTTPRequestHandler):
+    """Records the keys of the purge requests it receives."""
+
+    def do_PURGE(self):
+        self.server.received.append(self.headers.get('Surrogate-Key', ''))
+        self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class PurgeStubMixin:
+    """Runs a stub reverse proxy receiving purge requests."""
+
+    def setUp(self):
+        super().setUp()
+        self.proxy = ThreadingHTTPServer(('127.0.0.1', 0), PurgeHandler)
+        self.proxy.received = []
+        threading.Thread(target=self.proxy.serve_forever, daemon=True).start()
+        self.addCleanup(self.proxy.server_close)
+        self.addCleanup(self.proxy.shutdown)
+        self.purge_url = f'http://127.0.0.1:{self.proxy.server_port}/'
+
+    def purged_keys(self):
+        return {key for header in self.proxy.received
+                for key in header.split()}
+
+
+class PurgeTests(PurgeStubMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create(username='author')
+
+    def test_publishing_purges_post_and_tag_keys(self):
+        with override_settings(BLOG_PURGE_URL=self.purge_url):
+            post = Post.objects.create(title='Draft', slug='draft',
+                                       author=self.author, body='Body')
+            post.tags.add('django')
+            with self.captureOnCommitCallbacks(execute=True):
+                post.status = Post.Status.PUBLISHED
+                post.save()
+            purge.flush()
+
+        self.assertLessEqual({post_key(post.id), tag_key('django')},
+                             self.purged_keys())
+
+    def test_queued_keys_are_sent_when_the_process_exits(self):
+        # like a management command run from cron, exiting before
+        # BLOG_PURGE_DELAY has passed
+        code = ('from django.conf import settings\n'
+                f'settings.configure(BLOG_PURGE_URL={self.purge_url!r}, '
+                f'BLOG_PURGE_DELAY=60)\n'
+                'from blog import purge\n'
+                "purge._queue(['post-1'])\n")
+        subprocess.run([sys.executable, '-c', code], cwd=settings.BASE_DIR,
+                       check=True, timeout=30)
+
+        self.assertEqual(self.purged_keys(), {'post-1'})
+
+
+class StaleSurrogateKeyTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        author = User.objects.create(username='author')
+        self.post = Post.objects.create(title='Post', slug='post',
+                                        author=author, body='Body',
+                                        status=Post.Status.PUBLISHED)
+        self.post.tags.add('django')
+
+    def test_stale_pages_keep_their_surrogate_keys(self):
+        url = self.post.get_absolute_url()
+        fresh = self.client.get(url)
+
+        with mock.patch('blog.views.CommentForm',
+                        side_effect=OperationalError('database is down')):
+            stale = self.client.get(url)
+
+        self.assertEqual(stale['X-Blog-Stale'], '1')
+        self.assertEqual(stale['Surrogate-Key'], fresh['Surrogate-Key'])
+        self.assertIn(post_key(self.post.id), stale['Surrogate-Key'].split())
+
+
+class TwoTierCacheTests(TestCase):
+
+    def make_cache(self, **options):
+        options.setdefault('SHARED', 'shared')
+        two_tier = TwoTierCache(f'tests-{self.id()}', {'OPTIONS': options})
+        two_tier.clear()
+        return two_tier
+
+    def test_local_tier_is_bounded_by_size_and_age(self):
+        lru = LocalLRU(max_entries=2, timeout=5)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+
+        self.assertEqual(lru.get('b'), (False, None))
+        self.assertEqual(lru.get('a'), (True, 1))
+        with mock.patch('blog.cache_backends.time.monotonic',
+                        return_value=time.monotonic() + 6):
+            self.assertEqual(lru.get('a'), (False, None))
+
+    def test_excluded_keys_are_only_shared(self):
+        two_tier = self.make_cache(LOCAL_EXCLUDE=['blog:views:'])
+        two_tier.set('blog:views:1', 1)
+        two_tier.set('blog:page:1', 1)
+        two_tier.shared.set('blog:views:1', 2)
+        two_tier.shared.set('blog:page:1', 2)
+
+        self.assertEqual(two_tier.get('blog:views:1'), 2)
+        # kept in process for up to LOCAL_TIMEOUT seconds
+        self.assertEqual(two_tier.get('blog:page:1'), 1)
+
+    def test_incr_drops_the_local_copy(self):
+        two_tier = self.make_cache()
+        two_tier.set('blog:version', 1)
+
+        self.assertEqual(two_tier.incr('blog:version'), 2)
+        self.assertEqual(two_tier.get('blog:version'), 2)
+
+    def test_a_missing_key_is_computed_once(self):
+        two_tier = self.make_cache()
+        barrier = threading.Barrier(10)
+        calls = []
+        values = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'value'
+
+        def get():
+            barrier.wait()
+            values.append(two_tier.get_or_set('blog:slow', compute))
+
+        threads = [threading.Thread(target=get) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(values, ['value'] * 10)
+
+    def test_keys_about_to_expire_are_refreshed_early(self):
+        two_tier = self.make_cache(EARLY_REFRESH_BETA=1.0)
+        # expires in a second, and took ten seconds to compute
+        two_tier.set('blog:slow', Entry('old', time.time() + 1, 10))
+
+        with mock.patch('blog.cache_backends.random.random',
+                        return_value=0.5):
+            self.assertEqual(two_tier.get_or_set('blog:slow', lambda: 'new'),
+                             'new')
+
+    def test_early_refresh_can_be_disabled(self):
+        two_tier = self.make_cache(EARLY_REFRESH_BETA=0)
+        two_tier.set('blog:slow', Entry('old', time.time() + 1, 10))
+
+        self.assertEqual(two_tier.get_or_set('blog:slow', lambda: 'new'),
+                         'old')
+
+    def test_stats_are_counted_per_prefix(self):
+        two_tier = self.make_cache()
+        two_tier.get('blog:12:total_posts')
+        two_tier.set('blog:12:total_posts', 1)
+        two_tier.get('blog:13:total_posts')
+        two_tier.get('blog:12:total_posts')
+
+        self.assertEqual(two_tier.stats()['blog:total_posts'],
+                         {'misses': 2, 'local_hits': 1})
+
+
+class FakeConnection:
+    """Stands in for a psycopg2 connection in pool tests."""
+
+    def __init__(self):
+        self.closed = 0
+        self.rollbacks = 0
+        self.healthy = True
+
+    def cursor(self):
+        cursor = mock.MagicMock()
+        cursor.__enter__.return_value = cursor
+        if not self.healthy:
+            cursor.execute.side_effect = psycopg2.OperationalError(
+                'server closed the connection')
+        return cursor
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = 1
+
+
+class ConnectionPoolTests(SimpleTestCase):
+
+    def test_released_connections_are_reused(self):
+        pool = ConnectionPool()
+        connection = pool.checkout(FakeConnection)
+        pool.release(connection)
+
+        self.assertIs(pool.checkout(FakeConnection), connection)
+        self.assertEqual(connection.rollbacks, 1)
+        self.assertEqual(pool.stats()['connections_opened'], 1)
+        self.assertEqual(pool.stats()['checkouts'], 2)
+
+    def test_old_connections_are_recycled(self):
+        pool = ConnectionPool(max_age=0)
+        connection = pool.checkout(FakeConnection)
+        pool.release(connection)
+
+        self.assertIsNot(pool.checkout(FakeConnection), connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.stats()['connections_recycled'], 1)
+        self.assertEqual(pool.stats()['size'], 1)
+
+    def test_idle_connections_are_checked_before_use(self):
+        pool = ConnectionPool(health_check_interval=0)
+        connection = pool.checkout(FakeConnection)
+        pool.release(connection)
+        connection.healthy = False
+
+        self.assertIsNot(pool.checkout(FakeConnection), connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.stats()['failed_health_checks'], 1)
+
+    def test_checkouts_wait_for_a_free_connection(self):
+        pool = ConnectionPool(max_size=1, timeout=5)
+        connection = pool.checkout(FakeConnection)
+        threading.Timer(0.1, pool.release, [connection]).start()
+
+        self.assertIs(pool.checkout(FakeConnection), connection)
+        self.assertEqual(pool.stats()['waits'], 1)
+
+    def test_checkouts_time_out(self):
+        pool = ConnectionPool(max_size=1, timeout=0.1)
+        pool.checkout(FakeConnection)
+
+        with self.assertRaises(OperationalError):
+            pool.checkout(FakeConnection)
+        self.assertEqual(pool.stats()['timeouts'], 1)
+
+    def test_connections_of_a_parent_process_are_dropped(self):
+        pool = ConnectionPool()
+        inherited = FakeConnection()
+        pool.release(inherited)
+
+        self.assertIsNot(pool.checkout(FakeConnection), inherited)
+        # the parent may still be using it
+        self.assertFalse(inherited.closed)
+        self.assertEqual(inherited.rollbacks, 0)
+
+
+class CommentInvalidationTests(TestCase):
+
+    def test_comments_keep_cached_content(self):
+        author = User.objects.create(username='author')
+        post = Post.objects.create(title='Post', slug='post', author=author,
+                                   body='Body', status=Post.Status.PUBLISHED)
+        version = content_version()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            comment = Comment.objects.create(post=post, name='Reader',
+                                             email='reader@example.com',
+                                             body='Nice post')
+            comment.delete()
+
+        self.assertEqual(content_version(), version)
+
+
+class ViewCounterTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        author = User.objects.create(username='author')
+        self.posts = [Post.objects.create(title=f'Post {i}', slug=f'post-{i}',
+                                          author=author, body='Body',
+                                          status=Post.Status.PUBLISHED)
+                      for i in range(5)]
+
+    def test_only_viewed_posts_are_flushed(self):
+        for _ in range(3):
+            counters.record_view(self.posts[0].id)
+        counters.record_view(self.posts[1].id)
+
+        with mock.patch('blog.counters.buffered_counts',
+                        wraps=counters.buffered_counts) as buffered:
+            self.assertEqual(counters.flush_views(), 4)
+        self.assertEqual(sorted(buffered.call_args_list[0].args[1]),
+                         [self.posts[0].id, self.posts[1].id])
+
+        views = dict(PostViewDaily.objects.values_list('post_id', 'views'))
+        self.assertEqual(views, {self.posts[0].id: 3, self.posts[1].id: 1})
+
+    def test_views_after_a_flush_are_flushed_next_time(self):
+        counters.record_view(self.posts[0].id)
+        counters.flush_views()
+        self.assertEqual(counters.flush_views(), 0)
+
+        counters.record_view(self.posts[0].id)
+
+        self.assertEqual(counters.flush_views(), 1)
+        self.assertEqual(PostViewDaily.objects.get().views, 2)
+
+    def test_unwritten_log_positions_are_retried_then_skipped(self):
+        # a worker counted a position but has not written it yet
+        date = timezone.localdate()
+        counters.increment(counters.log_key(date, 'end'))
+        counters.record_view(self.posts[0].id)
+
+        self.assertEqual(counters.flush_views(), 0)
+        self.assertEqual(counters.flush_views(), 1)
+
+
+class WarmupTests(TestCase):
+
+    def test_connections_are_closed_after_warming_up(self):
+        author = User.objects.create(username='author')
+        Post.objects.create(title='Post', slug='post', author=author,
+                            body='Body', status=Post.Status.PUBLISHED)
+
+        with mock.patch('blog.warmup.connections') as connections:
+            statuses = [status for url, status in warm_up(1, 1)]
+
+        self.assertEqual(statuses, [200, 200, 200])
+        connections.close_all.assert_called_once_with()
+
+
+class RateLimitTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_concurrent_requests_share_the_limit(self):
+        barrier = threading.Barrier(20)
+        waits = []
+
+        def request():
+            barrier.wait()
+            waits.append(ratelimit.count_request('post_comment', '1.2.3.4',
+                                                 '5/m'))
+
+        threads = [threading.Thread(target=request) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(waits.count(0), 5)
+
+    @override_settings(BLOG_TRUST_X_FORWARDED_FOR=True)
+    def test_clients_are_identified_by_the_proxy_address(self):
+        request = RequestFactory().get(
+            '/', REMOTE_ADDR='10.0.0.1',
+            HTTP_X_FORWARDED_FOR='6.6.6.6, 1.2.3.4')
+
+        self.assertEqual(ratelimit.client_ip(request), '1.2.3.4')
+
+
+class StaleKeyTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        author = User.objects.create(username='author')
+        Post.objects.create(title='Post', slug='post', author=author,
+                            body='Body', status=Post.Status.PUBLISHED)
+
+    def test_only_allowed_parameters_select_a_copy(self):
+        for query in ['page=1', 'page=1&utm_source=feed', 'page=junk',
+                      'page=999']:
+            self.client.get(f'/blog/posts/?{query}')
+
+        self.assertIsNotNone(cache.get('blog:stale:/blog/posts/?page=1'))
+        self.assertIsNone(cache.get('blog:stale:/blog/posts/?page=junk'))
+        self.assertIsNone(cache.get('blog:stale:/blog/posts/?page=999'))
+
+
+class EdgeTTLTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        author = User.objects.create(username='author')
+        self.post = Post.objects.create(title='Post', slug='post',
+                                        author=author, body='Body',
+                                        status=Post.Status.PUBLISHED)
+
+    def test_pages_are_kept_by_proxies(self):
+        response = self.client.get(self.post.get_absolute_url())
+
+        self.assertEqual(response['Surrogate-Control'], 'max-age=300')
+
+    def test_errors_and_form_posts_are_not_kept(self):
+        responses = [
+            self.client.get('/blog/tag/unknown/'),
+            self.client.post(f'/blog/{self.post.id}/share/', {}),
+            self.client.post('/blog/search/', {'query': 'post'}),
+        ]
+
+        for response in responses:
+            self.assertNotIn('Surrogate-Control', response)
+
+
+class APITests(TestCase):
+
+    def test_post_detail_reads_tags_once(self):
+        author = User.objects.create(username='author')
+        post = Post.objects.create(title='Post', slug='post', author=author,
+                                   body='Body', status=Post.Status.PUBLISHED)
+        post.tags.add('django')
+
+        with mock.patch('blog.api.post_tag_slugs',
+                        wraps=api.post_tag_slugs) as post_tag_slugs:
+            response = self.client.get(f'/blog/api/posts/{post.id}/')
+
+        self.assertEqual(response.json()['tags'], ['django'])
+        post_tag_slugs.assert_called_once_with(post.id)
+
+
+class ExportFingerprintTests(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create(username='author')
+        self.post = self.create_post('post', 'django')
+
+    def create_post(self, slug, *tags):
+        post = Post.objects.create(title=slug, slug=slug, author=self.author,
+                                   body='Body', status=Post.Status.PUBLISHED)
+        post.tags.add(*tags)
+        return post
+
+    def fingerprint(self):
+        url = self.post.get_absolute_url()
+        return export_static.Command().pages()[export_static.output_path(url)]
+
+    def test_deleting_an_older_comment_changes_the_post(self):
+        older = Comment.objects.create(post=self.post, name='Reader',
+                                       email='reader@example.com', body='1')
+        Comment.objects.create(post=self.post, name='Reader',
+                               email='reader@example.com', body='2')
+        before = self.fingerprint()
+
+        older.delete()
+
+        self.assertNotEqual(self.fingerprint(), before)
+
+    def test_posts_sharing_tags_change_the_post(self):
+        other = self.create_post('other')
+        before = self.fingerprint()
+
+        # shown by the post as a similar post
+        other.tags.add('django')
+
+        self.assertNotEqual(self.fingerprint(), before)
+
+
+class SearchBackendTests:
+    """
+    Relevance and performance checks run against every search backend.
+
+    Subclasses set `backend_class` and `vendor`, and run only on that
+    database, so run the suite once per database to cover every engine.
+    """
+
+    backend_class = None
+    vendor = None
+    # queries a search may issue, whatever the number of posts
+    max_queries = None
+
+    def setUp(self):
+        if connection.vendor != self.vendor:
+            self.skipTest(f'needs a {self.vendor} database')
+        self.backend = self.backend_class()
+        self.author = User.objects.create(username='author')
+
+    def create_post(self, title, body, status=Post.Status.PUBLISHED):
+        return Post.objects.create(title=title, slug=title.lower()[:50],
+                                   author=self.author, body=body,
+                                   status=status)
+
+    def test_title_matches_rank_above_body_matches(self):
+        body_match = self.create_post('Notes', 'A few words about caching.')
+        title_match = self.create_post('Caching', 'A few words about it.')
+
+        results = self.backend.search('caching')
+
+        self.assertEqual(results, [title_match, body_match])
+        self.assertGreater(results[0].rank, results[1].rank)
+
+    def test_every_word_must_match(self):
+        both = self.create_post('Both', 'Django and PostgreSQL.')
+        self.create_post('One', 'Only Django.')
+
+        self.assertEqual(self.backend.search('django postgresql'), [both])
+
+    def test_drafts_are_not_found(self):
+        self.create_post('Draft', 'Unpublished caching.',
+                         status=Post.Status.DRAFT)
+
+        self.assertEqual(self.backend.search('caching'), [])
+
+    def test_query_syntax_is_searched_literally(self):
+        self.create_post('Syntax', 'Caching.')
+
+        for query in ['caching AND (', '"caching', 'title:caching*', '-']:
+            self.backend.search(query)
+
+    def test_edits_are_found(self):
+        post = self.create_post('Edited', 'About caching.')
+        post.body = 'About indexing.'
+        post.save()
+
+        self.assertEqual(self.backend.search('indexing'), [post])
+        self.assertEqual(self.backend.search('caching'), [])
+
+    def test_snippets_escape_the_body_and_mark_matches(self):
+        self.create_post('Snippet',
+                         'a < b & <script>alert(1)</script> caching')
+
+        snippet = self.backend.search('caching')[0].snippet
+
+        self.assertNotIn('<script>', snippet)
+        self.assertIn('a &lt; b &amp;', snippet)
+        self.assertIn('<mark>caching</mark>', snippet)
+
+    def test_rebuilding_finds_posts_written_without_signals(self):
+        post = self.create_post('Bulk', 'About caching.')
+        Post.objects.filter(id=post.id).update(body='About indexing.')
+
+        call_command('rebuild_search_index', stdout=StringIO())
+
+        self.assertEqual(self.backend.search('indexing'), [post])
+        self.assertEqual(self.backend.search('caching'), [])
+
+    def test_query_count_does_not_grow_with_results(self):
+        for i in range(30):
+            self.create_post(f'Post {i}', f'Caching post number {i}.')
+
+        with self.assertNumQueries(self.max_queries):
+            results = self.backend.search('caching', limit=20)
+            [post.snippet for post in results]
+        self.assertEqual(len(results), 20)
+
+
+class SQLiteSearchBackendTests(SearchBackendTests, TestCase):
+    backend_class = SQLiteSearchBackend
+    vendor = 'sqlite'
+    # the FTS5 query, then the posts
+    max_queries = 2
+
+
+class PostgresSearchBackendTests(SearchBackendTests, TestCase):
+    backend_class = PostgresSearchBackend
+    vendor = 'postgresql'
+    max_queries = 1
+
+
+class NegativeLookupTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        lookups._local.__dict__.clear()
+        self.author = User.objects.create(username='author')
+
+    def test_unknown_urls_are_rejected_without_queries(self):
+        lookups.current_filter()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/blog/tag/unknown/')
+                             .status_code, 404)
+            self.assertEqual(self.client.get('/blog/2001/1/1/unknown')
+                             .status_code, 404)
+
+    def test_known_urls_get_through(self):
+        post = Post.objects.create(title='Known', slug='known',
+                                   author=self.author, body='Body',
+                                   status=Post.Status.PUBLISHED)
+        post.tags.add('django')
+
+        self.assertEqual(self.client.get(post.get_absolute_url())
+                         .status_code, 200)
+        self.assertEqual(self.client.get('/blog/tag/django/').status_code,
+                         200)
+
+    def test_other_workers_see_a_new_version_at_once(self):
+        lookups.current_filter()
+        version = cache.get(lookups.VERSION_KEY)
+        # bumped by another worker, whose local tier this one cannot drop
+        cache.shared.incr(lookups.VERSION_KEY)
+
+        self.assertEqual(cache.get(lookups.VERSION_KEY), version + 1)
+
+    def test_post_published_during_a_rebuild_is_found(self):
+        old_filter = lookups.build_filter()
+        with self.captureOnCommitCallbacks(execute=True):
+            post = Post.objects.create(title='New', slug='new',
+                                       author=self.author, body='Body',
+                                       status=Post.Status.PUBLISHED)
+            # a concurrent request still sees the data before the commit
+            with mock.patch('blog.lookups.build_filter',
+                            return_value=old_filter):
+                lookups.current_filter()
+
+        self.assertEqual(self.client.get(post.get_absolute_url())
+                         .status_code, 200)
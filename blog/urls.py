@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import views, api
 
 app_name = 'blog'  # app namespace
 
@@ -17,4 +17,12 @@ urlpatterns = [
     path('<int:post_id>/comment/',
          views.post_comment, name='post_comment'),
     path('search/', views.post_search, name='post_search'),
+    # read-only JSON API
+    path('api/posts/', api.post_list, name='api_post_list'),
+    path('api/posts/<int:post_id>/', api.post_detail,
+         name='api_post_detail'),
+    path('api/posts/<int:post_id>/comments/', api.post_comments,
+         name='api_post_comments'),
+    path('api/tags/', api.tag_list, name='api_tag_list'),
+    path('api/metrics/', api.metrics, name='api_metrics'),
 ]
\ No newline at end of file
@@ -1,8 +1,14 @@
 from .models import Post
+from .counters import record_view, SKIP_VIEW_COUNT
 from .forms import EmailPostForm, CommentForm, SearchForm
-from django.contrib.postgres.search import SearchVector, SearchQuery, SearchRank
+from .lookups import may_exist, post_lookup_key, tag_lookup_key
+from .ratelimit import ratelimit
+from .search import get_search_backend
+from .surrogate import (add_surrogate_keys, add_post_keys, post_key,
+                        tag_key, POST_LIST_KEY)
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.core.mail import send_mail
+from django.http import Http404
 from django.shortcuts import render, get_object_or_404
 from django.views.generic import ListView
 from django.views.decorators.http import require_POST
@@ -33,13 +39,17 @@ def post_list(request, tag_slug=None):
         - `tag`: A Tag object if slug is provided, or None.
     """
 
-    post_list = Post.objects.filter(status='PB')
+    post_list = Post.objects.filter(status='PB').prefetch_related('tags')
     tag = None
 
     # If tag_slug provided, filter posts by tag
     if tag_slug:
+        # Unknown tags are rejected without querying the database
+        if not may_exist(tag_lookup_key(tag_slug)):
+            raise Http404('No Tag matches the given query.')
         tag = get_object_or_404(Tag, slug=tag_slug)
         post_list = post_list.filter(tags__in=[tag])
+        add_surrogate_keys(request, tag_key(tag.slug))
 
     # Paginate posts - 3 posts per page
     paginator = Paginator(post_list, 3)
@@ -49,9 +59,16 @@ def post_list(request, tag_slug=None):
     except PageNotAnInteger:
         # If page not an integer, show first page
         posts = paginator.page(1)
+        # and keep no stale copy for every invalid page number
+        request.blog_can_serve_stale = False
     except EmptyPage:
         # If page number out of range, show last page
         posts = paginator.page(paginator.num_pages)
+        request.blog_can_serve_stale = False
+
+    # Tag the response with the posts and tags it shows
+    add_surrogate_keys(request, POST_LIST_KEY)
+    add_post_keys(request, posts)
 
     return render(request,
                   'blog/post/list.html',
@@ -76,9 +93,13 @@ def post_detail(request, year, month, day, post):
        - `post`: The Post object representing the displayed post.
        - `comments`: A QuerySet of active comment objects related to the post.
        - `form`: An instance of the CommentForm for posting new comments.
-       - `similar_posts`: A QuerySet of recommended Posts sharing common tags with the post.
+       - `similar_posts`: A list of recommended Posts with similar content.
     """
 
+    # Unknown posts are rejected without querying the database
+    if not may_exist(post_lookup_key(year, month, day, post)):
+        raise Http404('No Post matches the given query.')
+
     post = get_object_or_404(Post,
                              status=Post.Status.PUBLISHED,
                              slug=post,
@@ -86,19 +107,34 @@ def post_detail(request, year, month, day, post):
                              publish__month=month,
                              publish__day=day)
 
+    # Count the view in the buffer flushed by `flush_post_views`
+    if not request.META.get(SKIP_VIEW_COUNT):
+        record_view(post.id)
+
     # Active comments for this post
     comments = post.comments.filter(active=True)
 
     # New comment form
     comment_form = CommentForm()
 
-    # List of similar, recommended posts
-    post_tags_ids = post.tags.values_list('id', flat=True)
-    similar_posts = Post.objects.filter(status='PB')\
-                                .filter(tags__in=post_tags_ids)\
-                                .exclude(id=post.id)
-    similar_posts = similar_posts.annotate(same_tags=Count('tags'))\
-                                 .order_by('-same_tags', '-publish')[:4]
+    # List of similar, recommended posts, precomputed by `build_similar_posts`
+    similar_posts = [similarity.similar for similarity in
+                     post.similarities.filter(similar__status='PB')
+                                      .select_related('similar')[:4]]
+
+    # Fall back to posts sharing tags until recommendations are built
+    if not similar_posts:
+        post_tags_ids = post.tags.values_list('id', flat=True)
+        similar_posts = Post.objects.filter(status='PB')\
+                                    .filter(tags__in=post_tags_ids)\
+                                    .exclude(id=post.id)
+        similar_posts = similar_posts.annotate(same_tags=Count('tags'))\
+                                     .order_by('-same_tags', '-publish')[:4]
+
+    # Tag the response with the posts and tags it shows
+    add_post_keys(request, [post])
+    add_surrogate_keys(request, *(post_key(similar.id)
+                                  for similar in similar_posts))
 
     return render(request,
                   'blog/post/detail.html',
@@ -124,6 +160,7 @@ class PostListView(ListView):
     template_name = 'blog/post/list.html'
 
 
+@ratelimit('post_share')
 def post_share(request, post_id):
     """
     Shares a published post by email using a form.
@@ -141,6 +178,7 @@ def post_share(request, post_id):
     """
 
     post = get_object_or_404(Post, id=post_id, status=Post.Status.PUBLISHED)
+    add_surrogate_keys(request, post_key(post.id))
     sent = False
 
     if request.method == 'POST':
@@ -165,6 +203,7 @@ def post_share(request, post_id):
 
 
 @require_POST
+@ratelimit('post_comment')
 def post_comment(request, post_id):
     """
     Create and save a comment for a published post.
@@ -204,8 +243,9 @@ def post_search(request):
 
     Context variables:
         - `query` - The query string entered by the user.
-        - `results` - A QuerySet of Post objects that match the query by title
-                      or body, ordered by relevance.
+        - `results` - A list of Post objects that match the query by title
+                      or body, ordered by relevance, with highlighted
+                      `snippet`s.
     """
 
     query = None
@@ -220,15 +260,11 @@ def post_search(request):
             # Get cleaned query data from the form
             # The cleaned_data dictionary contains the validated form data
             query = form.cleaned_data['query']
-            # Create a search vector based on title and body fields of posts
-            search_vector = SearchVector('title', 'body')
-            # Use the search vector and query to filter posts by status,
-            # annotate posts with a search rank based on relevance,
-            # and order posts by descending rank value
-            results = Post.objects.filter(status='PB').annotate(
-                search=search_vector,
-                rank=SearchRank(search_vector, query)
-            ).filter(search=query).order_by('-rank')
+            # Search published posts with the configured search backend,
+            # ordered by descending relevance
+            results = get_search_backend().search(query)
+            add_surrogate_keys(request, POST_LIST_KEY,
+                               *(post_key(post.id) for post in results))
 
     return render(request,
                   'blog/post/search.html',
@@ -0,0 +1,67 @@
+from django.conf import settings
+from django.db import connection, connections
+from django.urls import get_resolver, reverse
+from .counters import SKIP_VIEW_COUNT
+from .models import Post
+
+
+def warmup_host():
+    """Returns a host name allowed by ALLOWED_HOSTS for warmup requests."""
+
+    for host in settings.ALLOWED_HOSTS:
+        if host and not host.startswith(('.', '*')):
+            return host
+    return 'localhost'
+
+
+def warmup_urls(list_pages, top_posts):
+    """Returns the URLs rendered by `warm_up()`, most important first."""
+
+    urls = [reverse('blog:homepage')]
+    urls += [f"{reverse('blog:post_list')}?page={page}"
+             for page in range(1, list_pages + 1)]
+
+    posts = Post.objects.filter(status='PB')
+    ranked = list(posts.filter(ranking__total_views__gt=0)
+                       .order_by('-ranking__total_views')[:top_posts])
+    # fill up with the latest posts when few posts have been read
+    ranked += list(posts.exclude(id__in=[post.id for post in ranked])
+                        .order_by('-publish')[:top_posts - len(ranked)])
+    urls += [post.get_absolute_url() for post in ranked]
+    return urls
+
+
+def warm_up(list_pages=None, top_posts=None):
+    """
+    Prepares a worker for traffic.
+
+    Connects to the database, imports the URLconf and views, and
+    renders the homepage, the first listing pages and the top posts,
+    which also fills the sidebar caches and loads every template and
+    template tag library. Closes the database connections when done.
+    Returns a list of (url, status_code) tuples.
+    """
+
+    # imported here so workers without warmup never load the test client
+    from django.test import Client
+
+    if list_pages is None:
+        list_pages = getattr(settings, 'BLOG_WARMUP_LIST_PAGES', 3)
+    if top_posts is None:
+        top_posts = getattr(settings, 'BLOG_WARMUP_TOP_POSTS', 10)
+
+    try:
+        connection.ensure_connection()
+        # import the URLconf and every view module
+        get_resolver().url_patterns
+
+        # warmup requests must not count as views of the top posts
+        client = Client(HTTP_HOST=warmup_host(),
+                        raise_request_exception=False,
+                        **{SKIP_VIEW_COUNT: True})
+        return [(url, client.get(url).status_code)
+                for url in warmup_urls(list_pages, top_posts)]
+    finally:
+        # the test client keeps connections open; under gunicorn --preload
+        # this runs in the master, whose workers would inherit them
+        connections.close_all()
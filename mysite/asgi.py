@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mysite.settings')
 
 application = get_asgi_application()
+
+# render the busiest pages before the worker takes traffic
+if os.environ.get('BLOG_WARMUP'):
+    from blog.warmup import warm_up
+    warm_up()
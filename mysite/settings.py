@@ -2,12 +2,12 @@ from pathlib import Path
 from dotenv import load_dotenv
 import os
 
-load_dotenv()
-
-
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# load the project's .env directly instead of searching for one
+load_dotenv(BASE_DIR / '.env')
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/4.2/howto/deployment/checklist/
@@ -56,8 +56,107 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'blog.surrogate.SurrogateKeyMiddleware',
+    'blog.middleware.LoadSheddingMiddleware',
 ]
 
+# Overload protection
+
+# maximum number of requests processed concurrently by each view
+BLOG_CONCURRENCY_LIMITS = {
+    'blog:post_detail': 20,
+    'blog:post_list': 20,
+    'blog:post_list_by_tag': 10,
+    'blog:post_search': 5,
+    'blog:post_comment': 5,
+    'blog:post_share': 2,
+}
+BLOG_DEFAULT_CONCURRENCY_LIMIT = 10
+
+# seconds a request may wait for a free slot before being shed
+BLOG_ADMISSION_TIMEOUT = 0.5
+
+# average view duration (seconds) above which read views serve stale pages
+BLOG_SLOW_THRESHOLD = 2.0
+
+# minimum seconds between two writes of a page's stale copy
+BLOG_STALE_REFRESH = 60
+
+# fixed-window rate limits per client: '<requests>/<s|m|h|d>'
+BLOG_RATE_LIMITS = {
+    'post_comment': '5/m',
+    'post_share': '3/m',
+}
+
+# identify clients by the X-Forwarded-For address added by the reverse
+# proxy; set it only behind a proxy, clients can send the header themselves
+BLOG_TRUST_X_FORWARDED_FOR = \
+    os.environ.get('BLOG_TRUST_X_FORWARDED_FOR') == '1'
+
+# query parameters kept in the keys of stale responses, others are ignored
+BLOG_STALE_PARAMS = ['page', 'p']
+
+
+# Reverse proxy / CDN purging
+
+# endpoint receiving purge requests for changed surrogate keys;
+# purging is disabled when unset
+BLOG_PURGE_URL = os.environ.get('BLOG_PURGE_URL')
+BLOG_PURGE_METHOD = os.environ.get('BLOG_PURGE_METHOD', 'PURGE')
+BLOG_PURGE_HEADER = os.environ.get('BLOG_PURGE_HEADER', 'Surrogate-Key')
+
+# seconds changes are collected before purge requests are sent
+BLOG_PURGE_DELAY = 1
+
+# seconds proxies may keep HTML pages, bounding how stale the sidebar's
+# "most commented" list gets (comments do not purge it)
+BLOG_EDGE_TTL = 300
+
+
+# Search
+
+# dotted path of the search backend used by post_search; by default the
+# PostgreSQL or SQLite FTS5 backend is chosen to match the database
+BLOG_SEARCH_BACKEND = os.environ.get('BLOG_SEARCH_BACKEND')
+
+
+# Worker startup
+
+# import time budget (milliseconds) enforced by `check_import_time`
+BLOG_IMPORT_TIME_BUDGET_MS = 1500
+
+# pages rendered by `warmup` before a worker takes traffic
+BLOG_WARMUP_LIST_PAGES = 3
+BLOG_WARMUP_TOP_POSTS = 10
+
+
+# Post view counters
+
+# number of days counted in a post's trending views
+BLOG_TRENDING_DAYS = 7
+
+
+# Negative lookups
+
+# reject unknown post and tag URLs with a Bloom filter instead of a query
+BLOG_NEGATIVE_LOOKUPS = True
+
+
+# Comment partitioning
+
+# store comments in monthly PostgreSQL partitions; read when migration
+# 0021 runs, or use `maintain_comment_partitions --convert` afterwards
+BLOG_COMMENT_PARTITIONING = os.environ.get('BLOG_COMMENT_PARTITIONING') == '1'
+
+# months of partitions kept ready ahead of the current one
+BLOG_COMMENT_PARTITIONS_AHEAD = 3
+
+# months of comments kept attached, older ones are archived (None: all)
+BLOG_COMMENT_RETENTION_MONTHS = None
+
+# directory of the gzipped CSV files of archived partitions
+BLOG_COMMENT_ARCHIVE_DIR = BASE_DIR / 'comment_archive'
+
 ROOT_URLCONF = 'mysite.urls'
 
 TEMPLATES = [
@@ -85,15 +184,67 @@ WSGI_APPLICATION = 'mysite.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql_psycopg2',
+        # postgresql backend with a connection pool per worker process
+        'ENGINE': 'blog.db_backends.postgresql_pool',
         'NAME': os.environ.get('DB_NAME'),
         'USER': os.environ.get('DB_USER'),
         'PASSWORD': os.environ.get('DB_PASS'),
         'HOST': '127.0.0.1',
         'PORT': '5432',
+        # connections are returned to the pool at the end of each request
+        'CONN_MAX_AGE': 0,
+        'POOL': {
+            'MAX_SIZE': 10,
+            'MAX_AGE': 60 * 30,
+            'TIMEOUT': 10,
+            'HEALTH_CHECK_INTERVAL': 30,
+        },
     }
 }
 
+# small single-node deployments can run on SQLite instead
+if os.environ.get('DB_ENGINE') == 'sqlite':
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+    }
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+CACHES = {
+    # in-process LRU in front of the shared cache, see blog.cache_backends
+    'default': {
+        'BACKEND': 'blog.cache_backends.TwoTierCache',
+        'TIMEOUT': 60 * 15,
+        'OPTIONS': {
+            'SHARED': 'shared',
+            'LOCAL_MAX_ENTRIES': 1000,
+            'LOCAL_TIMEOUT': 5,
+            # counters and large responses are only kept in the shared cache;
+            # the content version is kept locally, so other workers see a new
+            # version within LOCAL_TIMEOUT seconds, but the lookups version
+            # is not: a worker with an old filter would 404 new posts
+            'LOCAL_EXCLUDE': ['blog:ratelimit:', 'blog:views:',
+                              'blog:stale:', 'blog:lookups_version'],
+        },
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('REDIS_URL'),
+        'TIMEOUT': 60 * 15,
+    },
+}
+
+# without Redis (development, tests) each process has its own cache, so
+# rate limits, view buffers and invalidations are not shared by workers
+if not os.environ.get('REDIS_URL'):
+    CACHES['shared'] = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'TIMEOUT': 60 * 15,
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
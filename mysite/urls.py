@@ -3,7 +3,9 @@ from django.contrib import admin
 from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib.sitemaps.views import sitemap
+from blog.caching import cache_versioned
 from blog.sitemaps import PostSitemap
+from blog.surrogate import surrogate_keys, SITEMAP_KEY
 
 # maps section names to sitemap classes
 sitemaps = {
@@ -13,7 +15,9 @@ sitemaps = {
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('blog/', include('blog.urls', namespace='blog')),
-    path('sitemap.xml', sitemap, {'sitemaps': sitemaps},
+    path('sitemap.xml',
+         surrogate_keys(SITEMAP_KEY)(cache_versioned('sitemap')(sitemap)),
+         {'sitemaps': sitemaps},
          name='django.contrib.sitemaps.views.sitemap')
 ]
 
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mysite.settings')
 
 application = get_wsgi_application()
+
+# render the busiest pages before the worker takes traffic
+if os.environ.get('BLOG_WARMUP'):
+    from blog.warmup import warm_up
+    warm_up()